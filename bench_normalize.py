@@ -0,0 +1,74 @@
+"""Benchmark normalize_image() against the previous conversion paths.
+
+Run with ``python bench_normalize.py``. Images are synthetic, so no sample
+files are needed; results are printed as mean seconds per call.
+"""
+import logging
+import time
+
+# main.py is a Streamlit script; importing it outside `streamlit run` logs a
+# "missing ScriptRunContext" warning for every widget, which we don't need here.
+logging.disable(logging.WARNING)
+
+import numpy as np
+from PIL import Image
+
+from main import normalize_image
+
+SIZES = [(1024, 768), (4000, 3000)]
+REPEAT = 5
+
+
+def legacy_flatten(img):
+    """The RGBA -> JPEG path convert_image_format used before normalize_image."""
+    if img.mode == 'RGBA':
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        rgb_img.paste(img, mask=img.split()[3] if len(img.split()) == 4 else None)
+        img = rgb_img
+    return img
+
+
+def point_bit_depth(img):
+    """Pillow point() based 16 -> 8 bit reduction.
+
+    The old convert('RGB') call is not a useful baseline here: it clips
+    16-bit data at 255 and produces an all-white page.
+    """
+    return img.convert('I').point(lambda v: v / 257).convert('L')
+
+
+def make_images(size):
+    rng = np.random.default_rng(0)
+    width, height = size
+    pixels = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    # fromarray() shares the buffer, so copy before making the opaque variant.
+    partial = Image.fromarray(pixels.copy(), 'RGBA')
+    pixels[..., 3] = 255
+    opaque = Image.fromarray(pixels, 'RGBA')
+    deep = Image.fromarray(rng.integers(0, 65536, (height, width), dtype=np.uint16))
+    return {'RGBA (partial alpha)': partial, 'RGBA (opaque)': opaque, 'I;16': deep}
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func(*args)
+    return (time.perf_counter() - start) / REPEAT
+
+
+def main():
+    print(f"{'size':>11}  {'input':<20} {'target':<6} {'baseline':>9} {'normalize':>9} {'speedup':>8}")
+    for size in SIZES:
+        for label, img in make_images(size).items():
+            if img.mode == 'RGBA':
+                target, legacy = 'JPEG', legacy_flatten
+            else:
+                target, legacy = 'PDF', point_bit_depth
+            old = timeit(legacy, img)
+            new = timeit(normalize_image, img, target)
+            print(f"{size[0]:>5}x{size[1]:<5}  {label:<20} {target:<6} "
+                  f"{old:>9.4f} {new:>9.4f} {old / new:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
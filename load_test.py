@@ -0,0 +1,326 @@
+"""Concurrent-session load test for the FileConverter Pro app.
+
+Drives N simultaneous headless sessions (Streamlit's AppTest, so no browser
+or network is involved) through the three conversion tabs using a synthetic
+corpus generated on the fly, then reports latency percentiles, throughput,
+failure/rejection rates and memory growth per session.
+
+    python load_test.py --sessions 8 --rounds 3
+    python load_test.py --sessions 16 --max-p95 20 --max-failure-rate 0.05
+
+Sessions share one process, exactly like a deployed server, so the
+server-wide scheduler and caches are exercised for real. The PDF scenario
+needs poppler (pdftoppm) on PATH and is skipped without it. Requires a
+Streamlit release whose AppTest supports file uploads.
+
+Exits with status 1 when a --max-* threshold is exceeded, so it can gate
+deployments.
+"""
+import argparse
+import io
+import os
+import resource
+import shutil
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+from PIL import Image, ImageDraw
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test as _app_test
+from streamlit.testing.v1 import local_script_runner as _local_script_runner
+from streamlit.testing.v1.util import patch_config_options
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+SCENARIOS = ['pdf_to_images', 'images_to_pdf', 'image_convert']
+REJECTED_MARKER = 'server is busy'
+# Every scenario ends with a download link; a run without one did nothing.
+# Match the link's attribute, not the class name, which the page CSS also contains.
+SUCCESS_MARKER = 'class="mobile-download-btn"'
+BARRIER_TIMEOUT = 300
+
+
+class _SharedRuntimeMeta(type):
+    def __setattr__(cls, name, value):
+        # Keep the first mock Runtime AppTest installs and ignore later swaps
+        # and the reset to None at the end of every run.
+        if name == '_instance':
+            if value is not None and Runtime._instance is None:
+                Runtime._instance = value
+            return
+        super().__setattr__(name, value)
+
+
+class _SharedRuntime(Runtime, metaclass=_SharedRuntimeMeta):
+    pass
+
+
+@contextmanager
+def shared_app_test_globals():
+    """Let many AppTest sessions run concurrently in one process.
+
+    AppTest assumes one test at a time: every run installs its own mock
+    Runtime, config patch and ScriptCache and tears them down afterwards,
+    which breaks sessions running in parallel threads (and recompiling the
+    script concurrently trips a CPython 3.11 ast bug). Install them once and
+    share them between sessions, as a real server does.
+    """
+    script_cache = ScriptCache()
+    saved = (_app_test.Runtime, _app_test.ScriptCache,
+             _local_script_runner.ScriptCache, _app_test.patch_config_options)
+    _app_test.Runtime = _SharedRuntime
+    _app_test.ScriptCache = _local_script_runner.ScriptCache = lambda: script_cache
+    _app_test.patch_config_options = lambda overrides: nullcontext()
+    try:
+        with patch_config_options({'global.appTest': True}):
+            yield
+    finally:
+        (_app_test.Runtime, _app_test.ScriptCache,
+         _local_script_runner.ScriptCache, _app_test.patch_config_options) = saved
+        Runtime._instance = None
+
+
+# ── Synthetic corpus ───────────────────────────────────────────────────────────
+def _photo(size, seed):
+    rng = np.random.default_rng(seed)
+    height, width = size[1], size[0]
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 127 // (width + height)], -1)
+    noise = rng.normal(0, 12, base.shape)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), 'RGB')
+
+
+def _text_page(size, seed):
+    page = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(page)
+    for line in range(40, size[1] - 40, 24):
+        draw.text((50, line), f"Synthetic page {seed} line {line} " * 4, fill='black')
+    return page
+
+
+def _encode(img, fmt, **kwargs):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def build_corpus(pages=4, image_edge=1600):
+    """Return upload tuples (filename, content, mime) for every scenario."""
+    size = (image_edge, image_edge * 3 // 4)
+    page_size = (1240, 1754)
+    pages_img = [_text_page(page_size, i) if i % 2 else _photo(page_size, i) for i in range(pages)]
+    pdf = _encode(pages_img[0], 'PDF', save_all=True, append_images=pages_img[1:])
+
+    transparent = _photo(size, 7).convert('RGBA')
+    transparent.putalpha(180)
+    images = [
+        ('photo.jpg', _encode(_photo(size, 1), 'JPEG', quality=90), 'image/jpeg'),
+        ('scan.png', _encode(_text_page(size, 2), 'PNG'), 'image/png'),
+        ('overlay.png', _encode(transparent, 'PNG'), 'image/png'),
+    ]
+    return {
+        'pdf': ('document.pdf', pdf, 'application/pdf'),
+        'images': images,
+    }
+
+
+# ── Scenarios ──────────────────────────────────────────────────────────────────
+def _outcome(at):
+    """Classify a finished run as 'ok', 'rejected' or 'failed'.
+
+    A run only counts as ok if it produced a download link; one that
+    silently did nothing (e.g. after a widget key changed) is a failure.
+    """
+    if at.exception:
+        return 'failed'
+    messages = [e.value for e in at.error]
+    if any(REJECTED_MARKER in m for m in messages):
+        return 'rejected'
+    if messages or not any(SUCCESS_MARKER in m.value for m in at.markdown):
+        return 'failed'
+    return 'ok'
+
+
+def run_pdf_to_images(at, corpus, output_format):
+    at.file_uploader(key='pdf_to_img').set_value(corpus['pdf'])
+    at.run()
+    at.selectbox(key='pdf_output_format').set_value(output_format)
+    at.button(key='convert_pdf_btn').click()
+    return at
+
+
+def run_images_to_pdf(at, corpus, output_format):
+    at.file_uploader(key='img_to_pdf').set_value(corpus['images'])
+    at.run()
+    at.button(key='pdf_btn').click()
+    return at
+
+
+def run_image_convert(at, corpus, output_format):
+    at.file_uploader(key='img_convert').set_value(corpus['images'][0])
+    at.run()
+    at.selectbox(key='to_format').set_value(output_format)
+    at.button(key='convert_btn').click()
+    return at
+
+
+SCENARIO_RUNNERS = {
+    'pdf_to_images': run_pdf_to_images,
+    'images_to_pdf': run_images_to_pdf,
+    'image_convert': run_image_convert,
+}
+
+
+# ── Measurement ────────────────────────────────────────────────────────────────
+def current_rss_bytes():
+    """Resident set size of this process; falls back to peak RSS off Linux."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def fresh_session(timeout):
+    """A new session with the page loaded, like a user (re)opening the app."""
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.run()
+    return at
+
+
+def session_worker(session_index, scenarios, rounds, corpus, output_format, timeout, results, start_barrier):
+    try:
+        at = fresh_session(timeout)
+    except Exception as e:
+        at = None  # loading is retried, and counted, in the first round
+        print(f"  session {session_index} load: {type(e).__name__}: {e}", file=sys.stderr)
+    finally:
+        # Always reach the barrier so the other sessions and the main thread
+        # are never left waiting; the timeout covers a thread that hangs.
+        try:
+            start_barrier.wait(BARRIER_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+    for round_index in range(rounds):
+        scenario = scenarios[(session_index + round_index) % len(scenarios)]
+        began = time.perf_counter()
+        try:
+            if at is None:
+                # Fresh session state for every round after the first.
+                at = fresh_session(timeout)
+            SCENARIO_RUNNERS[scenario](at, corpus, output_format)
+            at.run()
+            outcome = _outcome(at)
+        except Exception as e:  # timeouts and harness errors count as failures
+            outcome = 'failed'
+            print(f"  session {session_index} {scenario}: {type(e).__name__}: {e}", file=sys.stderr)
+        results.append((scenario, outcome, time.perf_counter() - began))
+        at = None
+
+
+def run_load_test(sessions, rounds, scenarios, output_format, timeout):
+    corpus = build_corpus()
+    results = []
+    barrier = threading.Barrier(sessions + 1)
+    threads = [
+        threading.Thread(
+            target=session_worker,
+            args=(i, scenarios, rounds, corpus, output_format, timeout, results, barrier),
+            daemon=True,
+        )
+        for i in range(sessions)
+    ]
+    rss_before = current_rss_bytes()
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait(BARRIER_TIMEOUT)
+    except threading.BrokenBarrierError:
+        print("some sessions did not start in time; measuring the rest", file=sys.stderr)
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - began
+    rss_after = current_rss_bytes()
+    return results, wall_time, rss_before, rss_after
+
+
+def report(results, wall_time, sessions, rss_before, rss_after):
+    """Print the summary table and return overall (p95, failure_rate)."""
+    by_scenario = defaultdict(list)
+    for scenario, outcome, latency in results:
+        by_scenario[scenario].append((outcome, latency))
+
+    print(f"\n{'scenario':<15} {'jobs':>5} {'ok':>5} {'reject':>6} {'fail':>5} "
+          f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7}")
+    for scenario, rows in sorted(by_scenario.items()):
+        latencies = [latency for outcome, latency in rows if outcome == 'ok'] or [float('nan')]
+        counts = defaultdict(int)
+        for outcome, _ in rows:
+            counts[outcome] += 1
+        print(f"{scenario:<15} {len(rows):>5} {counts['ok']:>5} {counts['rejected']:>6} {counts['failed']:>5} "
+              f"{percentile(latencies, 50):>7.2f} {percentile(latencies, 95):>7.2f} "
+              f"{percentile(latencies, 99):>7.2f} {max(latencies):>7.2f}")
+
+    ok_latencies = [latency for _, outcome, latency in results if outcome == 'ok']
+    not_ok = sum(1 for _, outcome, _ in results if outcome != 'ok')
+    failure_rate = not_ok / len(results) if results else 0.0
+    p95 = percentile(ok_latencies, 95) if ok_latencies else float('inf')
+    growth = (rss_after - rss_before) / 1024 / 1024
+
+    print(f"\nsessions: {sessions}   jobs: {len(results)}   wall time: {wall_time:.2f}s")
+    print(f"throughput: {len(ok_latencies) / wall_time:.2f} jobs/s   "
+          f"failure rate (incl. rejections): {failure_rate:.1%}")
+    print(f"memory: {rss_before / 1024 / 1024:.0f} MB -> {rss_after / 1024 / 1024:.0f} MB "
+          f"({growth:+.1f} MB total, {growth / sessions:+.1f} MB per session)")
+    return p95, failure_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sessions', type=int, default=8, help='concurrent sessions')
+    parser.add_argument('--rounds', type=int, default=3, help='conversions per session')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--format', default='PNG', help='output format for PDF/image conversions')
+    parser.add_argument('--timeout', type=float, default=120, help='per-run timeout in seconds')
+    parser.add_argument('--max-p95', type=float, help='fail if p95 latency (s) exceeds this')
+    parser.add_argument('--max-failure-rate', type=float, help='fail if this fraction of jobs fail')
+    args = parser.parse_args()
+
+    scenarios = list(args.scenarios)
+    if 'pdf_to_images' in scenarios and shutil.which('pdftoppm') is None:
+        print("pdftoppm not found; skipping pdf_to_images", file=sys.stderr)
+        scenarios.remove('pdf_to_images')
+    if not scenarios:
+        parser.error('no runnable scenarios')
+
+    with shared_app_test_globals():
+        results, wall_time, rss_before, rss_after = run_load_test(
+            args.sessions, args.rounds, scenarios, args.format, args.timeout
+        )
+    p95, failure_rate = report(results, wall_time, args.sessions, rss_before, rss_after)
+
+    failed = False
+    if args.max_p95 is not None and p95 > args.max_p95:
+        print(f"FAIL: p95 latency {p95:.2f}s exceeds {args.max_p95:.2f}s")
+        failed = True
+    if args.max_failure_rate is not None and failure_rate > args.max_failure_rate:
+        print(f"FAIL: failure rate {failure_rate:.1%} exceeds {args.max_failure_rate:.1%}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,24 @@
 # app.py
 import streamlit as st
-from PIL import Image
+from PIL import Image, ImageCms, ImageOps, ExifTags, UnidentifiedImageError
+import numpy as np
 import pdf2image
 import img2pdf
 import os
 import tempfile
+import subprocess
 from pathlib import Path
 import io
 import zipfile
 import base64
 import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from contextlib import contextmanager
 from datetime import datetime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # Page configuration
 st.set_page_config(
@@ -402,76 +410,1109 @@ with col2:
     with col_b:
         st.metric("Success Rate", "100%", "0%", label_visibility="collapsed")
 
+# ── Color-mode normalization ───────────────────────────────────────────────────
+# Modes each encoder writes natively. Anything else is mapped onto the
+# closest of these by normalize_image() before saving; only PNG can keep
+# 16-bit grayscale, every other format gets it reduced to 8 bits.
+ENCODER_MODES = {
+    'JPEG': {'RGB', 'L'},
+    'PNG': {'RGB', 'RGBA', 'L', 'LA', 'P', '1', 'I;16'},
+    'WEBP': {'RGB', 'RGBA'},
+    'BMP': {'RGB', 'L', 'P', '1'},
+    'GIF': {'RGB', 'RGBA', 'L', 'P', '1'},
+    'PDF': {'RGB', 'L', '1', 'CMYK'},
+}
+ALPHA_FORMATS = {'PNG', 'WEBP', 'GIF'}
+HIGH_BIT_DEPTH_MODES = {'I', 'F', 'I;16', 'I;16L', 'I;16B', 'I;16N'}
+FLATTEN_BACKGROUND = (255, 255, 255)
+# value // 257, rounded: maps 0..65535 onto 0..255 by table lookup.
+_SIXTEEN_TO_EIGHT_BIT = ((np.arange(65536, dtype=np.uint32) + 128) // 257).astype(np.uint8)
+
+
+def _reduce_bit_depth(img):
+    """Scale a 16/32-bit integer or float image down to 8-bit grayscale.
+
+    Pillow's own convert('L') clips these modes at 255, which turns every
+    16-bit scan pure white, so the raw array is rescaled from the range of
+    its mode: 0..65535 for integer modes (Pillow also opens 16-bit files as
+    mode I) and 0..1 for float images. Values outside the range are clipped.
+    """
+    arr = np.asarray(img)
+    if img.mode == 'F':
+        out = np.clip(arr * 255.0 + 0.5, 0, 255).astype(np.uint8)
+    else:
+        if arr.dtype != np.uint16:
+            arr = np.clip(arr, 0, 65535).astype(np.uint16)
+        out = np.take(_SIXTEEN_TO_EIGHT_BIT, arr)
+    return Image.fromarray(out, 'L')
+
+
+def _flatten_alpha(img, modes):
+    """Composite an RGBA/LA image onto FLATTEN_BACKGROUND.
+
+    Fully opaque images skip compositing entirely; otherwise the alpha band
+    is extracted once and used as the paste mask in a single C-level pass.
+    """
+    base_mode = 'L' if img.mode == 'LA' and 'L' in modes else 'RGB'
+    alpha = img.getchannel('A')
+    if alpha.getextrema() == (255, 255):
+        return img.convert(base_mode)
+    background = FLATTEN_BACKGROUND
+    if base_mode == 'L':
+        background = round(sum(background) / 3)
+        img = img.convert('L')
+    flat = Image.new(base_mode, img.size, background)
+    flat.paste(img, mask=alpha)
+    return flat
+
+
+def normalize_image(img, target_format):
+    """Return ``img`` in a mode the ``target_format`` encoder can write.
+
+    Alpha is kept where the target supports it and flattened onto white
+    otherwise; palette transparency, CMYK and high bit-depth images are
+    mapped onto their closest 8-bit equivalent.
+    """
+    target = target_format.upper()
+    if target == 'JPG':
+        target = 'JPEG'
+    modes = ENCODER_MODES[target]
+
+    if img.mode in HIGH_BIT_DEPTH_MODES:
+        if 'I;16' in modes and img.mode != 'F':
+            # Pillow's own conversion between 16-bit layouts clips at 255.
+            return img if img.mode == 'I;16' else Image.fromarray(
+                np.clip(np.asarray(img), 0, 65535).astype(np.uint16))
+        img = _reduce_bit_depth(img)
+
+    if img.mode == 'P':
+        if 'transparency' not in img.info or target in ALPHA_FORMATS:
+            if 'P' in modes:
+                return img
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    elif img.mode == 'PA':
+        img = img.convert('RGBA')
+    elif img.mode in ('RGBa', 'La'):
+        img = img.convert(img.mode.upper())
+
+    if img.mode in modes:
+        return img
+    if img.mode in ('RGBA', 'LA'):
+        if 'RGBA' in modes:
+            return img.convert('RGBA')
+        return _flatten_alpha(img, modes)
+    if img.mode == '1' and 'L' in modes:
+        return img.convert('L')
+    return img.convert('RGB')
+
+
+# ── Adaptive output format ─────────────────────────────────────────────────────
+AUTO_FORMAT = 'Auto'
+AUTO_PROBE_TILE = 256
+AUTO_DEFAULT_QUALITY = 85
+PALETTE_MAX_COLORS = 256
+# Lossless output is chosen while it is at most this many times the size of
+# the best lossy candidate. Measured on native-resolution probes, screenshots
+# and rendered text pages come out at about 0.05-1x, photos at 5-9x.
+LOSSLESS_MAX_RATIO = 2.0
+# Share of neighbouring probe pixels differing by at most FLAT_GRADIENT.
+# Photos measured 0.17-0.44, screenshots and rendered pages 0.66-0.99;
+# below PHOTO_MAX_FLAT_FRACTION the (slow) lossless trials are skipped.
+FLAT_GRADIENT = 2
+PHOTO_MAX_FLAT_FRACTION = 0.55
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'BMP': 'bmp', 'GIF': 'gif'}
+
+
+def analyze_image(img):
+    """Cheap content statistics used to pick an output format.
+
+    Colour count is taken on the full image (getcolors bails out as soon as
+    the limit is exceeded); flatness is measured on the probe tiles, where
+    photo grain and sensor noise are still at their native scale.
+    """
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+    if has_alpha:
+        alpha = img.convert('RGBA').getchannel('A')
+        has_alpha = alpha.getextrema() != (255, 255)
+    colors = img.getcolors(PALETTE_MAX_COLORS) if img.mode not in HIGH_BIT_DEPTH_MODES else None
+
+    gray = np.asarray(normalize_image(probe_tiles(img), 'JPEG').convert('L'), dtype=np.int16)
+    steps = np.abs(np.diff(gray, axis=1))
+    flat_fraction = float((steps <= FLAT_GRADIENT).mean()) if steps.size else 1.0
+
+    return {
+        'has_alpha': has_alpha,
+        'colors': len(colors) if colors is not None else None,
+        'flat_fraction': flat_fraction,
+    }
+
+
+def probe_tiles(img, tile=AUTO_PROBE_TILE):
+    """Return a 2x2 mosaic of full-resolution tiles taken across ``img``.
+
+    Downscaling would blur text and alias photo noise, both of which change
+    how the image compresses, so the probe keeps the original pixel scale.
+    """
+    if img.width <= 2 * tile and img.height <= 2 * tile:
+        return img
+    tile_w, tile_h = min(tile, img.width), min(tile, img.height)
+    mosaic = Image.new(img.mode, (tile_w * 2, tile_h * 2))
+    if img.mode == 'P':
+        mosaic.putpalette(img.getpalette())
+    for index, (fx, fy) in enumerate(((1, 1), (2, 1), (1, 2), (2, 2))):
+        x = min(max(0, img.width * fx // 3 - tile_w // 2), img.width - tile_w)
+        y = min(max(0, img.height * fy // 3 - tile_h // 2), img.height - tile_h)
+        mosaic.paste(img.crop((x, y, x + tile_w, y + tile_h)), ((index % 2) * tile_w, (index // 2) * tile_h))
+    return mosaic
+
+
+def _encoded_size(img, fmt, save_kwargs):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **save_kwargs)
+    return buffer.tell()
+
+
+def choose_output_format(img, quality=AUTO_DEFAULT_QUALITY):
+    """Pick the format and encoder settings giving the smallest output for img.
+
+    Candidates are trial-encoded on a full-resolution probe. Lossless output
+    (PNG or lossless WEBP) wins while it stays within LOSSLESS_MAX_RATIO of
+    the best lossy candidate, so text and line art never get lossy
+    artefacts; otherwise JPEG/WEBP at ``quality`` is used. Clearly
+    photographic images skip the lossless trials, and images with few
+    colours only get lossless candidates, PNG as an exact palette.
+    ``quality`` is the user's bound and is not searched below.
+    Returns (image_to_save, format, save_kwargs).
+    """
+    stats = analyze_image(img)
+
+    lossless = [('PNG', {'optimize': True}), ('WEBP', {'lossless': True})]
+    if stats['colors'] is not None:
+        lossy = []
+    elif stats['has_alpha']:
+        lossy = [('WEBP', {'quality': quality})]
+    else:
+        lossy = [('JPEG', {'quality': quality, 'optimize': True}), ('WEBP', {'quality': quality})]
+
+    if lossy and stats['flat_fraction'] < PHOTO_MAX_FLAT_FRACTION:
+        lossless = []
+
+    def prepare(image, fmt):
+        image = normalize_image(image, fmt)
+        if fmt == 'PNG' and stats['colors'] is not None and image.mode == 'RGB':
+            # Lossless here: with at most 256 colours every one gets its own entry.
+            image = image.quantize(colors=stats['colors'], method=Image.Quantize.MAXCOVERAGE,
+                                   dither=Image.Dither.NONE)
+        return image
+
+    probe = probe_tiles(img)
+
+    def smallest(candidates):
+        return min(((c, _encoded_size(prepare(probe, c[0]), *c)) for c in candidates),
+                   key=lambda entry: entry[1])
+
+    if not lossless:
+        (fmt, save_kwargs), _ = smallest(lossy)
+    else:
+        (fmt, save_kwargs), lossless_size = smallest(lossless)
+        if lossy:
+            best_lossy, lossy_size = smallest(lossy)
+            if lossless_size > LOSSLESS_MAX_RATIO * lossy_size:
+                fmt, save_kwargs = best_lossy
+    return prepare(img, fmt), fmt, save_kwargs
+
+
+def encode_image(img, output_format, quality=None, metadata=None):
+    """Encode img as output_format (or AUTO_FORMAT); returns (extension, bytes).
+
+    ``quality`` applies to lossy formats; None keeps the encoder's default.
+    ``metadata`` holds extra save() arguments such as exif and icc_profile.
+    """
+    if output_format == AUTO_FORMAT:
+        img, fmt, save_kwargs = choose_output_format(img, quality or AUTO_DEFAULT_QUALITY)
+    else:
+        fmt = 'JPEG' if output_format.upper() == 'JPG' else output_format.upper()
+        img = normalize_image(img, fmt)
+        save_kwargs = {'quality': quality} if quality and fmt in ('JPEG', 'WEBP') else {}
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **save_kwargs, **(metadata or {}))
+    return FORMAT_EXTENSIONS.get(fmt, fmt.lower()), buffer.getvalue()
+
+
+# ── Server-wide admission control ──────────────────────────────────────────────
+# Every browser session runs in the same server process, so these limits are
+# shared by all users. They can be tuned per deployment via the environment.
+MAX_CONCURRENT_CONVERSIONS = int(os.environ.get('FILECONVERTER_MAX_CONCURRENT', os.cpu_count() or 2))
+MAX_INFLIGHT_BYTES = int(os.environ.get('FILECONVERTER_MAX_INFLIGHT_MB', 512)) * 1024 * 1024
+MAX_QUEUED_JOBS = int(os.environ.get('FILECONVERTER_MAX_QUEUED', 20))
+QUEUE_POLL_SECONDS = 0.5
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the server queue is full."""
+
+
+class _Ticket:
+    __slots__ = ('session_id', 'nbytes', 'admitted')
+
+    def __init__(self, session_id, nbytes):
+        self.session_id = session_id
+        self.nbytes = nbytes
+        self.admitted = False
+
+
+class ConversionScheduler:
+    """Caps concurrent conversions and in-flight bytes across all sessions.
+
+    Waiting jobs are queued per session and admitted round-robin, so one
+    user submitting many large files cannot starve everyone else. A job
+    larger than the byte budget is still admitted once nothing else runs.
+    """
+
+    def __init__(self, max_concurrent, max_inflight_bytes, max_queued):
+        self.max_concurrent = max_concurrent
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_queued = max_queued
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # session_id -> deque of waiting tickets
+        self._queued = 0
+        self._running = 0
+        self._inflight_bytes = 0
+
+    def submit(self, session_id, nbytes):
+        with self._cond:
+            if self._queued >= self.max_queued:
+                raise QueueFullError(
+                    f"The server is busy ({self._queued} jobs waiting). Please try again shortly."
+                )
+            ticket = _Ticket(session_id, nbytes)
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._queued += 1
+            self._dispatch()
+            return ticket
+
+    def _dispatch(self):
+        # Strict round-robin: only the next session in turn may start a job,
+        # which keeps large jobs from being overtaken indefinitely.
+        while self._queues and self._running < self.max_concurrent:
+            session_id, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+            if self._running and self._inflight_bytes + ticket.nbytes > self.max_inflight_bytes:
+                break
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._queued -= 1
+            self._running += 1
+            self._inflight_bytes += ticket.nbytes
+            ticket.admitted = True
+        self._cond.notify_all()
+
+    def try_acquire(self, session_id, nbytes=0):
+        """Admit a ticket at once if a slot is free and nobody waits; else None."""
+        with self._cond:
+            if self._queues or self._running >= self.max_concurrent:
+                return None
+            ticket = _Ticket(session_id, nbytes)
+            self._running += 1
+            self._inflight_bytes += nbytes
+            ticket.admitted = True
+            return ticket
+
+    def position(self, ticket):
+        """1-based place of a waiting ticket in admission order, 0 if running."""
+        with self._cond:
+            if ticket.admitted:
+                return 0
+            queues = [list(q) for q in self._queues.values()]
+            place = 0
+            for depth in range(max(len(q) for q in queues)):
+                for queue in queues:
+                    if depth < len(queue):
+                        place += 1
+                        if queue[depth] is ticket:
+                            return place
+            return 0
+
+    def wait(self, ticket, on_wait=None):
+        while True:
+            with self._cond:
+                if ticket.admitted:
+                    return
+            if on_wait is not None:
+                on_wait(self.position(ticket))
+            with self._cond:
+                if not ticket.admitted:
+                    self._cond.wait(QUEUE_POLL_SECONDS)
+
+    def release(self, ticket):
+        with self._cond:
+            if ticket.admitted:
+                self._running -= 1
+                self._inflight_bytes -= ticket.nbytes
+            else:
+                queue = self._queues.get(ticket.session_id)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[ticket.session_id]
+            self._dispatch()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'running': self._running,
+                'queued': self._queued,
+                'inflight_bytes': self._inflight_bytes,
+            }
+
+    @contextmanager
+    def slot(self, session_id, nbytes, on_wait=None):
+        """Block until the job may run; always frees its place on exit."""
+        ticket = self.submit(session_id, nbytes)
+        try:
+            self.wait(ticket, on_wait)
+            yield
+        finally:
+            self.release(ticket)
+
+
+@st.cache_resource
+def get_scheduler():
+    """Process-wide scheduler shared by every session."""
+    return ConversionScheduler(MAX_CONCURRENT_CONVERSIONS, MAX_INFLIGHT_BYTES, MAX_QUEUED_JOBS)
+
+
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+
+@contextmanager
+def conversion_slot(nbytes):
+    """Wait for a server-wide conversion slot, showing queue position meanwhile.
+
+    Raises QueueFullError straight away if the server queue is already full.
+    """
+    status = st.empty()
+
+    def show_position(position):
+        status.info(f"⏳ Server busy — your job is #{position} in the queue")
+
+    with get_scheduler().slot(current_session_id(), nbytes, on_wait=show_position):
+        status.empty()
+        yield
+
+
+@contextmanager
+def spare_slots(count):
+    """Take up to ``count`` more slots that are free right now; yields how many.
+
+    Never waits, so a parallel batch only spreads onto idle capacity and
+    queued jobs keep their turn.
+    """
+    scheduler = get_scheduler()
+    tickets = []
+    try:
+        for _ in range(count):
+            ticket = scheduler.try_acquire(current_session_id())
+            if ticket is None:
+                break
+            tickets.append(ticket)
+        yield len(tickets)
+    finally:
+        for ticket in tickets:
+            scheduler.release(ticket)
+
+
+def run_admitted(nbytes, convert, *args, timing=None):
+    """Run ``convert(*args)`` once admitted; returns None if the queue is full.
+
+    If a ``timing`` dict is given, the run time excluding the queue wait is
+    stored in it under 'seconds'.
+    """
+    try:
+        with conversion_slot(nbytes):
+            started = time.perf_counter()
+            result = convert(*args)
+            if timing is not None:
+                timing['seconds'] = time.perf_counter() - started
+            return result
+    except QueueFullError as e:
+        st.error(f"🚦 {e}")
+        return None
+
+
+# ── Cancellation and timeouts ──────────────────────────────────────────────────
+JOB_TIMEOUT_SECONDS = float(os.environ.get('FILECONVERTER_JOB_TIMEOUT', 300))
+PAGE_TIMEOUT_SECONDS = float(os.environ.get('FILECONVERTER_PAGE_TIMEOUT', 60))
+RENDER_DPI = 200
+CANCEL_POLL_SECONDS = 0.25
+
+
+class ConversionCancelled(Exception):
+    """Raised inside a conversion once its job is cancelled or out of time."""
+
+
+class PageTimeout(Exception):
+    """Raised when a single page exceeds PAGE_TIMEOUT_SECONDS."""
+
+
+class JobControl:
+    """Deadline, cancellation flag and running subprocess of one conversion.
+
+    Streamlit stops a script at its next st.* call when the user reruns it
+    (e.g. clicks Cancel) or closes the tab. ``on_tick`` is called while a
+    subprocess runs so that call happens regularly; the resulting exception
+    unwinds through run_subprocess(), which kills the process on the way out.
+    Conversions call start() once they run, so time spent waiting in the
+    server queue does not count towards the timeout.
+    """
+
+    def __init__(self, timeout=JOB_TIMEOUT_SECONDS, on_tick=None):
+        self.timeout = timeout
+        self.on_tick = on_tick
+        self.reason = None
+        self.start()
+
+    def start(self):
+        """(Re)start the deadline from now."""
+        self.deadline = time.monotonic() + self.timeout
+
+    def cancel(self, reason="Conversion cancelled"):
+        if self.reason is None:
+            self.reason = reason
+
+    def check(self):
+        if self.reason is None and time.monotonic() > self.deadline:
+            self.cancel(f"Conversion timed out after {self.timeout:.0f}s")
+        if self.reason is not None:
+            raise ConversionCancelled(self.reason)
+
+    def run_subprocess(self, args, timeout=PAGE_TIMEOUT_SECONDS):
+        """Run ``args`` to completion, killing it on cancel or timeout."""
+        self.check()
+        started = time.monotonic()
+        proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    returncode = proc.wait(CANCEL_POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                self.check()
+                if time.monotonic() - started > timeout:
+                    raise PageTimeout(f"{Path(args[0]).name} took longer than {timeout:.0f}s")
+                if self.on_tick is not None:
+                    self.on_tick(time.monotonic() - started)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        if returncode != 0:
+            raise RuntimeError(f"{Path(args[0]).name} exited with status {returncode}")
+
+
+def render_pdf_page(job, pdf_path, page, workdir, dpi=RENDER_DPI):
+    """Render one page with pdftoppm under ``job``'s control; returns a loaded Image."""
+    prefix = os.path.join(workdir, f"page_{page}")
+    job.run_subprocess([
+        'pdftoppm', '-f', str(page), '-l', str(page), '-r', str(dpi),
+        '-singlefile', pdf_path, prefix,
+    ])
+    ppm_path = f"{prefix}.ppm"
+    try:
+        with Image.open(ppm_path) as image:
+            image.load()
+            return image.copy()
+    finally:
+        os.remove(ppm_path)
+
+
+# ── Resize and transform ───────────────────────────────────────────────────────
+RESIZE_ORIGINAL = 'Original size'
+RESIZE_MAX_EDGE = 'Max edge'
+RESIZE_EXACT_BOX = 'Exact box'
+RESIZE_PERCENT = 'Percentage'
+RESIZE_MODES = [RESIZE_ORIGINAL, RESIZE_MAX_EDGE, RESIZE_EXACT_BOX, RESIZE_PERCENT]
+# resize() first shrinks by an integer factor with reduce() while the image
+# is still at least this many times the target, then resamples the rest.
+RESIZE_REDUCING_GAP = 3.0
+# EXIF orientations that swap width and height.
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+SRGB_PROFILE = ImageCms.createProfile('sRGB')
+
+
+def convert_to_srgb(img):
+    """Convert pixels from the embedded ICC profile to sRGB.
+
+    Without a profile viewers assume sRGB, so stripping a wide-gamut
+    (e.g. Display P3) or CMYK profile without converting first shifts the
+    colours. Images already in sRGB, in other modes, or whose profile
+    cannot be read are returned unchanged.
+    """
+    icc = img.info.get('icc_profile')
+    if not icc or img.mode not in ('RGB', 'RGBA', 'CMYK'):
+        return img
+    try:
+        profile = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+        if 'sRGB' in ImageCms.getProfileDescription(profile):
+            return img
+        output_mode = 'RGBA' if img.mode == 'RGBA' else 'RGB'
+        converted = ImageCms.profileToProfile(img, profile, SRGB_PROFILE, outputMode=output_mode)
+    except (OSError, ImageCms.PyCMSError):
+        return img
+    converted.info = {key: value for key, value in img.info.items() if key != 'icc_profile'}
+    return converted
+
+
+def target_size(size, resize_mode=RESIZE_ORIGINAL, resize_value=None):
+    """Output size for ``size`` under a resize mode; never upscales for Max edge.
+
+    ``resize_value`` is the edge length in pixels for RESIZE_MAX_EDGE, a
+    (width, height) tuple for RESIZE_EXACT_BOX and a percentage for
+    RESIZE_PERCENT.
+    """
+    width, height = size
+    if resize_mode == RESIZE_EXACT_BOX:
+        return tuple(resize_value)
+    if resize_mode == RESIZE_MAX_EDGE:
+        scale = min(1.0, resize_value / max(width, height))
+    elif resize_mode == RESIZE_PERCENT:
+        scale = resize_value / 100
+    else:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def transform_image_file(image_file, output_format, resize_mode=RESIZE_ORIGINAL,
+                         resize_value=None, strip_metadata=True, quality=None):
+    """Open, orient, resize and encode one uploaded image.
+
+    Returns (filename, bytes) and raises on failure. JPEGs are decoded at a
+    reduced DCT scale when that still covers the target size, which skips
+    most of the decode work for large downscales.
+    """
+    image_file.seek(0)
+    img = Image.open(image_file)
+
+    orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+    size = target_size(img.size[::-1] if orientation in TRANSPOSED_ORIENTATIONS else img.size,
+                       resize_mode, resize_value)
+    raw_size = size[::-1] if orientation in TRANSPOSED_ORIENTATIONS else size
+    if raw_size[0] < img.width and raw_size[1] < img.height:
+        img.draft(img.mode, raw_size)
+
+    img = ImageOps.exif_transpose(img)
+    if img.size != size:
+        # reduce() has no 16-bit grayscale support.
+        reducing_gap = None if img.mode.startswith('I;16') else RESIZE_REDUCING_GAP
+        img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+
+    metadata = None
+    if strip_metadata:
+        img = convert_to_srgb(img)
+        img.info = {key: value for key, value in img.info.items() if key == 'transparency'}
+    else:
+        if img.mode not in ENCODER_MODES.get(output_format.upper(), ()):
+            # Saving changes the mode (e.g. CMYK -> RGB), which the embedded
+            # profile would no longer describe: move to sRGB first, or drop a
+            # profile that cannot be converted.
+            img = convert_to_srgb(img)
+            img.info.pop('icc_profile', None)
+        metadata = {'exif': img.getexif().tobytes()}
+        if 'icc_profile' in img.info:
+            metadata['icc_profile'] = img.info['icc_profile']
+
+    extension, data = encode_image(img, output_format, quality, metadata)
+    return f"{Path(image_file.name).stem}.{extension}", data
+
+
+def make_zip(named_files):
+    """Pack (filename, bytes) pairs into a ZIP, renaming duplicate names."""
+    zip_buffer = io.BytesIO()
+    seen = set()
+    with zipfile.ZipFile(zip_buffer, 'w') as zf:
+        for filename, data in named_files:
+            stem, extension = os.path.splitext(filename)
+            candidate, counter = filename, 1
+            while candidate in seen:
+                counter += 1
+                candidate = f"{stem}_{counter}{extension}"
+            seen.add(candidate)
+            zf.writestr(candidate, data)
+    return zip_buffer.getvalue()
+
+
+# ── Batch error isolation ──────────────────────────────────────────────────────
+def upload_key(uploaded_file):
+    """Identity of an uploaded file that is stable across reruns."""
+    return getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+
+
+def session_cache(name, settings):
+    """Per-session cache of finished batch items, reset when ``settings`` change."""
+    caches = st.session_state.setdefault('batch_caches', {})
+    if name not in caches or caches[name][0] != settings:
+        caches[name] = (settings, {})
+    return caches[name][1]
+
+
+def drop_session_cache(name):
+    """Free a session cache once nothing is left to retry."""
+    st.session_state.get('batch_caches', {}).pop(name, None)
+
+
+def run_batch(keyed_items, process, cache=None, results=None, failures=None, workers=1, on_item=None):
+    """Apply ``process`` to each (key, label, item), isolating failures per item.
+
+    Successful values are appended to ``results`` in input order and stored
+    in ``cache`` under their key; items already cached are not processed
+    again, so re-running a batch only redoes what failed. Failures are
+    appended to ``failures`` as (label, reason). Cancellation is not a
+    per-item failure and propagates. Cache entries for items no longer in
+    the batch are dropped.
+    """
+    cache = {} if cache is None else cache
+    results = [] if results is None else results
+    failures = [] if failures is None else failures
+
+    def attempt(entry):
+        key, label, item = entry
+        if key in cache:
+            return key, label, cache[key], None
+        try:
+            return key, label, process(item), None
+        except ConversionCancelled:
+            raise
+        except UnidentifiedImageError:
+            return key, label, None, "not a readable image file"
+        except Exception as e:
+            return key, label, None, str(e) or type(e).__name__
+
+    def collect(outcomes):
+        for key, label, value, error in outcomes:
+            if error is None:
+                cache[key] = value
+                results.append(value)
+            else:
+                failures.append((label, error))
+            if on_item is not None:
+                on_item(len(results) + len(failures), len(keyed_items))
+
+    if workers > 1 and len(keyed_items) > 1:
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            collect(pool.map(attempt, keyed_items))
+        finally:
+            # After a cancellation or rerun, don't start the items still queued.
+            pool.shutdown(cancel_futures=True)
+    else:
+        collect(map(attempt, keyed_items))
+
+    keys = {key for key, _, _ in keyed_items}
+    for key in [key for key in cache if key not in keys]:
+        del cache[key]
+    return results
+
+
+def offer_retry(slot, already_shown, failures, label, key):
+    """Show or clear the Retry button in ``slot`` after a batch run.
+
+    The button is normally rendered before the run starts (so its click is
+    seen on the next rerun); this covers the run in which failures first
+    appear or all clear up.
+    """
+    if failures and not already_shown:
+        slot.button(label, key=key, use_container_width=True)
+    elif not failures and already_shown:
+        slot.empty()
+
+
+def show_failures(failures, noun):
+    """Warn about failed batch items, listing each one with its reason."""
+    if failures:
+        st.warning(f"⚠️ {len(failures)} {noun}(s) failed; everything else was converted. "
+                   f"Use Retry to redo only the failed ones.")
+        with st.expander("Failure details", expanded=False):
+            for label, reason in failures:
+                st.markdown(f"- **{label}**: {reason}")
+
+
+# ── Cost estimation ────────────────────────────────────────────────────────────
+ESTIMATE_SAMPLE_PAGES = 2
+ESTIMATE_SAMPLE_DPI = 72
+ESTIMATE_SAMPLE_EDGE = 512
+ESTIMATE_TIMEOUT_SECONDS = 15
+# Sampling takes a server slot like any job, weighted as a small one.
+ESTIMATE_SLOT_BYTES = 1024 * 1024
+# Decoded bitmap, normalized copy and encoder buffer are alive at once.
+PEAK_BITMAP_COPIES = 3
+# Outputs are held in memory and copied once more into the ZIP / PDF.
+PEAK_OUTPUT_COPIES = 2
+COST_LEARNING_RATE = 0.3
+LARGE_OUTPUT_BYTES = 500 * 1024 * 1024
+
+
+class CostModel:
+    """Correction factors learned from finished jobs, shared by all sessions.
+
+    Estimates extrapolate from a small sample, which misses per-job overhead
+    and variation between pages. After each complete job the ratio of actual
+    to estimated duration and size is folded into a moving average per
+    (pipeline, format), and later estimates are scaled by it.
+    """
+
+    def __init__(self, learning_rate=COST_LEARNING_RATE):
+        self.learning_rate = learning_rate
+        self._lock = threading.Lock()
+        self._factors = {}
+
+    def correct(self, pipeline, output_format, estimate):
+        with self._lock:
+            factors = self._factors.get((pipeline, output_format), {'seconds': 1.0, 'bytes': 1.0, 'jobs': 0})
+        corrected = dict(estimate)
+        corrected['seconds'] = estimate['seconds'] * factors['seconds']
+        corrected['bytes'] = estimate['bytes'] * factors['bytes']
+        corrected['jobs'] = factors['jobs']
+        return corrected
+
+    def record(self, pipeline, output_format, estimate, actual_seconds, actual_bytes):
+        with self._lock:
+            factors = self._factors.setdefault((pipeline, output_format), {'seconds': 1.0, 'bytes': 1.0, 'jobs': 0})
+            rate = 1.0 if factors['jobs'] == 0 else self.learning_rate
+            for name, actual in (('seconds', actual_seconds), ('bytes', actual_bytes)):
+                if estimate[name] > 0:
+                    factors[name] += rate * (actual / estimate[name] - factors[name])
+            factors['jobs'] += 1
+
+
+@st.cache_resource
+def get_cost_model():
+    """Process-wide cost model shared by every session."""
+    return CostModel()
+
+
+def sample_pdf(pdf_bytes):
+    """Page count plus up to ESTIMATE_SAMPLE_PAGES pages rendered at ESTIMATE_SAMPLE_DPI.
+
+    Returns {'items', 'samples': [(image, render_seconds)]}. The pages are
+    the first and the middle one; everything else is extrapolated.
+    """
+    job = JobControl(timeout=ESTIMATE_TIMEOUT_SECONDS)
+    with tempfile.TemporaryDirectory() as path:
+        pdf_path = os.path.join(path, 'input.pdf')
+        with open(pdf_path, 'wb') as f:
+            f.write(pdf_bytes)
+        page_count = pdf2image.pdfinfo_from_path(pdf_path, timeout=ESTIMATE_TIMEOUT_SECONDS)['Pages']
+        samples = []
+        for page in sorted({1, (page_count + 1) // 2})[:ESTIMATE_SAMPLE_PAGES]:
+            started = time.perf_counter()
+            image = render_pdf_page(job, pdf_path, page, path, ESTIMATE_SAMPLE_DPI)
+            samples.append((image, time.perf_counter() - started))
+    return {'items': page_count, 'samples': samples}
+
+
+def sample_images(image_files):
+    """Header info for every upload plus a small decoded copy of the largest.
+
+    Returns None if no upload is readable. Only the sample is decoded, at
+    most ESTIMATE_SAMPLE_EDGE pixels across and via draft() for JPEGs.
+    """
+    headers = []
+    for image_file in image_files:
+        image_file.seek(0)
+        try:
+            with Image.open(image_file) as img:
+                headers.append({'size': img.size, 'passthrough': img.format == 'JPEG' and img.mode in ENCODER_MODES['PDF'],
+                                'nbytes': image_file.size, 'file': image_file})
+        except Exception:
+            continue  # unreadable files are reported as failures when converting
+    if not headers:
+        return None
+    
+    largest = max(headers, key=lambda header: header['size'][0] * header['size'][1])
+    started = time.perf_counter()
+    largest['file'].seek(0)
+    img = Image.open(largest['file'])
+    img.draft('RGB', (ESTIMATE_SAMPLE_EDGE, ESTIMATE_SAMPLE_EDGE))
+    # reduce() has no 16-bit grayscale support.
+    img.thumbnail((ESTIMATE_SAMPLE_EDGE, ESTIMATE_SAMPLE_EDGE),
+                  reducing_gap=None if img.mode.startswith('I;16') else RESIZE_REDUCING_GAP)
+    img = ImageOps.exif_transpose(img)
+    for header in headers:
+        del header['file']
+    return {'items': len(image_files), 'headers': headers, 'sample': img,
+            'decode_seconds': time.perf_counter() - started}
+
+
+def estimate_pdf_job(sample, output_format, quality=None, dpi=RENDER_DPI):
+    """Predict output bytes, seconds and peak memory for a PDF to images job.
+
+    The low-resolution sample pages are encoded with the chosen settings and
+    the per-pixel cost is scaled to ``dpi`` and the full page count.
+    """
+    scale = (dpi / ESTIMATE_SAMPLE_DPI) ** 2
+    seconds = output_bytes = max_pixels = 0
+    for image, render_seconds in sample['samples']:
+        started = time.perf_counter()
+        _, data = encode_image(image, output_format, quality)
+        seconds += render_seconds + time.perf_counter() - started
+        output_bytes += len(data)
+        max_pixels = max(max_pixels, image.width * image.height)
+    
+    per_page = scale * sample['items'] / len(sample['samples'])
+    total_bytes = output_bytes * per_page
+    return {
+        'items': sample['items'],
+        'bytes': total_bytes,
+        'seconds': seconds * per_page,
+        'peak_bytes': max_pixels * scale * 3 * PEAK_BITMAP_COPIES + total_bytes * PEAK_OUTPUT_COPIES,
+    }
+
+
+def estimate_image_job(sample, output_format, to_pdf=False, workers=1, **transform):
+    """Predict output bytes, seconds and peak memory for an image batch.
+
+    The decoded sample is encoded with the chosen settings and its per-pixel
+    cost is scaled to every image's output size. For ``to_pdf``, JPEG
+    uploads are embedded as they are and count at their upload size.
+    """
+    img = sample['sample']
+    started = time.perf_counter()
+    if to_pdf:
+        buffer = io.BytesIO()
+        normalize_image(img, 'PDF').save(buffer, 'PNG')
+        sample_bytes = buffer.tell()
+    else:
+        _, data = encode_image(img, output_format, transform.get('quality'))
+        sample_bytes = len(data)
+    sample_seconds = sample['decode_seconds'] + time.perf_counter() - started
+    sample_pixels = max(1, img.width * img.height)
+    
+    total_bytes = 0
+    pixels = []
+    for header in sample['headers']:
+        if to_pdf:
+            width, height = header['size']
+            total_bytes += header['nbytes'] if header['passthrough'] else sample_bytes / sample_pixels * width * height
+        else:
+            width, height = target_size(header['size'], transform.get('resize_mode', RESIZE_ORIGINAL),
+                                        transform.get('resize_value'))
+            total_bytes += sample_bytes / sample_pixels * width * height
+        pixels.append(max(width * height, header['size'][0] * header['size'][1]))
+    
+    parallel = 1 if to_pdf else min(workers, len(pixels))
+    return {
+        'items': sample['items'],
+        'bytes': total_bytes,
+        'seconds': sample_seconds / sample_pixels * sum(pixels) / parallel,
+        'peak_bytes': sum(sorted(pixels)[-parallel:]) * 3 * PEAK_BITMAP_COPIES + total_bytes * PEAK_OUTPUT_COPIES,
+    }
+
+
+def cached_sample(pipeline, key, take_sample):
+    """Return the cost sample for ``key``, taking it at most once per session.
+
+    Sampling renders or decodes real data, so it waits for a server slot
+    like any conversion. Returns None if sampling fails or the queue is
+    full; conversion can still go ahead. A full queue is not remembered,
+    so sampling is tried again on the next rerun.
+    """
+    samples = st.session_state.setdefault('cost_samples', {})
+    if pipeline not in samples or samples[pipeline][0] != key:
+        try:
+            with st.spinner("Estimating conversion cost..."), conversion_slot(ESTIMATE_SLOT_BYTES):
+                value = take_sample()
+        except QueueFullError:
+            return None
+        except Exception:
+            value = None
+        samples[pipeline] = (key, value)
+    return samples[pipeline][1]
+
+
+def cached_estimate(pipeline, settings, sample, estimate):
+    """Return ``estimate(sample)`` for ``settings``, computed once per change.
+
+    Returns None without a sample or if estimation fails.
+    """
+    estimates = st.session_state.setdefault('cost_estimates', {})
+    if pipeline not in estimates or estimates[pipeline][0] != settings:
+        try:
+            value = estimate(sample) if sample is not None else None
+        except Exception:
+            value = None
+        estimates[pipeline] = (settings, value)
+    return estimates[pipeline][1]
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{max(seconds, 0.1):.1f}s"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s"
+
+
+def show_estimate(pipeline, output_format, estimate):
+    """Show the learned-corrected estimate for a job before it is started."""
+    if estimate is None:
+        st.caption("📏 Cost estimate unavailable for this input")
+        return
+    corrected = get_cost_model().correct(pipeline, output_format, estimate)
+    calibration = f" · calibrated on {corrected['jobs']} past job(s)" if corrected['jobs'] else ""
+    st.markdown(
+        f'<div class="file-info">📏 Estimate for {corrected["items"]} item(s): '
+        f'~{format_bytes(corrected["bytes"])} output · ~{format_duration(corrected["seconds"])} · '
+        f'peak memory ~{format_bytes(corrected["peak_bytes"])}{calibration}</div>',
+        unsafe_allow_html=True
+    )
+    if corrected['bytes'] > LARGE_OUTPUT_BYTES:
+        st.warning(f"⚠️ This job is expected to produce about {format_bytes(corrected['bytes'])}. "
+                   f"Consider a lower DPI, a lossy format or resizing.")
+
+
+def record_job_cost(pipeline, output_format, estimate, timing, output_bytes):
+    """Feed a finished, complete job back into the shared cost model."""
+    if estimate is not None and 'seconds' in timing:
+        get_cost_model().record(pipeline, output_format, estimate, timing['seconds'], output_bytes)
+
+
 # Conversion functions
-def convert_pdf_to_images(pdf_bytes, output_format):
-    """Convert PDF to images"""
+def convert_pdf_to_images(pdf_bytes, output_format, quality=None, job=None, results=None,
+                          on_page=None, cache=None, failures=None, dpi=RENDER_DPI):
+    """Convert PDF to images page by page; with AUTO_FORMAT the format is chosen per page.
+
+    Finished pages are appended to ``results`` as they complete, so a caller
+    holding that list keeps them even if the run is interrupted. A page that
+    fails or exceeds the per-page timeout is recorded in ``failures`` and
+    the others continue; pages already in ``cache`` are not rendered again.
+    On job timeout or cancellation the pages finished so far are returned.
+    """
+    job = job or JobControl()
+    job.start()
+    image_bytes_list = [] if results is None else results
     try:
         with tempfile.TemporaryDirectory() as path:
-            images = pdf2image.convert_from_bytes(
-                pdf_bytes,
-                output_folder=path,
-                fmt=output_format.lower()
-            )
+            pdf_path = os.path.join(path, 'input.pdf')
+            with open(pdf_path, 'wb') as f:
+                f.write(pdf_bytes)
+            page_count = pdf2image.pdfinfo_from_path(pdf_path, timeout=PAGE_TIMEOUT_SECONDS)['Pages']
             
-            image_bytes_list = []
-            for i, image in enumerate(images):
-                img_byte_arr = io.BytesIO()
-                image.save(img_byte_arr, format=output_format)
-                img_byte_arr.seek(0)
-                image_bytes_list.append((f"page_{i+1}.{output_format.lower()}", img_byte_arr.getvalue()))
+            def convert_page(page):
+                image = render_pdf_page(job, pdf_path, page, path, dpi)
+                extension, data = encode_image(image, output_format, quality)
+                return f"page_{page}.{extension}", data
             
-            return image_bytes_list
+            pages = [(page, f"Page {page}", page) for page in range(1, page_count + 1)]
+            return run_batch(pages, convert_page, cache, image_bytes_list, failures, on_item=on_page)
+    except ConversionCancelled as e:
+        st.warning(f"⏹️ {e} — kept {len(image_bytes_list)} finished page(s)")
+        return image_bytes_list
     except Exception as e:
         st.error(f"Error converting PDF: {str(e)}")
         return None
 
-def convert_images_to_pdf(image_files):
-    """Convert multiple images to PDF"""
+def encode_pdf_page(image_file):
+    """Encode one upload as JPEG or PNG bytes that img2pdf embeds as a page.
+
+    JPEGs in a mode PDF supports are passed through untouched; anything
+    else is normalized and stored losslessly as PNG, or as JPEG for CMYK,
+    which PNG cannot hold. Raises ValueError for an image img2pdf rejects,
+    e.g. one whose page would be under 3 or over 14400 PDF units.
+    """
+    image_file.seek(0)
+    img = Image.open(image_file)
+    if img.format == 'JPEG' and img.mode in ENCODER_MODES['PDF']:
+        image_file.seek(0)
+        data = image_file.read()
+    else:
+        img = normalize_image(img, 'PDF')
+        buffer = io.BytesIO()
+        if img.mode == 'CMYK':
+            img.save(buffer, 'JPEG', quality=95)
+        else:
+            img.save(buffer, 'PNG')
+        data = buffer.getvalue()
+    # img2pdf only checks pages while assembling the whole document; trying
+    # each one alone (cheap, nothing is re-encoded) keeps a bad page from
+    # failing the rest.
+    img2pdf.convert(data, rotation=img2pdf.Rotation.ifvalid)
+    return data
+
+def convert_images_to_pdf(image_files, job=None, cache=None, failures=None):
+    """Convert multiple images to PDF, leaving out images that fail to load.
+
+    Pages are kept (and cached for retries) as encoded bytes, not decoded
+    bitmaps, so a large batch costs about its upload size in memory.
+    """
+    job = job or JobControl()
+    job.start()
+    
+    def load(image_file):
+        job.check()
+        return encode_pdf_page(image_file)
+    
     try:
-        pdf_bytes = io.BytesIO()
-        images = []
+        pages = []
         
-        for image_file in image_files:
-            img = Image.open(image_file)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            images.append(img)
+        try:
+            run_batch([(upload_key(f), f.name, f) for f in image_files], load, cache, pages, failures)
+        except ConversionCancelled as e:
+            st.warning(f"⏹️ {e} — the PDF contains {len(pages)} of {len(image_files)} images")
         
-        if images:
-            images[0].save(pdf_bytes, 'PDF', save_all=True, append_images=images[1:])
-            pdf_bytes.seek(0)
-            return pdf_bytes.getvalue()
+        if pages:
+            return img2pdf.convert(pages, rotation=img2pdf.Rotation.ifvalid)
     except Exception as e:
         st.error(f"Error converting images to PDF: {str(e)}")
         return None
 
-def convert_image_format(image_file, output_format):
-    """Convert image from one format to another"""
+def convert_image_format(image_file, output_format, **transform):
+    """Convert image from one format to another, optionally resizing it"""
     try:
-        img = Image.open(image_file)
-        
-        if output_format.upper() == 'JPG':
-            output_format = 'JPEG'
-        
-        if img.mode == 'RGBA' and output_format.upper() in ['JPEG', 'JPG']:
-            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-            rgb_img.paste(img, mask=img.split()[3] if len(img.split()) == 4 else None)
-            img = rgb_img
-        
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format=output_format.upper())
-        img_byte_arr.seek(0)
-        
-        original_name = Path(image_file.name).stem
-        extension = output_format.lower()
-        if output_format.upper() == 'JPEG':
-            extension = 'jpg'
-        
-        return (f"{original_name}.{extension}", img_byte_arr.getvalue())
+        return transform_image_file(image_file, output_format, **transform)
     except Exception as e:
         st.error(f"Error converting image: {str(e)}")
         return None
 
+def convert_images_batch(image_files, output_format, workers=2, job=None, cache=None, failures=None,
+                         on_item=None, **transform):
+    """Transform and convert many images in parallel; failed images are recorded in ``failures``.
+
+    Runs in one admitted slot and uses up to ``workers`` threads only while
+    as many slots are free. On job timeout the images finished so far are
+    returned.
+    """
+    job = job or JobControl()
+    job.start()
+    converted = []
+    
+    def convert(image_file):
+        job.check()
+        return transform_image_file(image_file, output_format, **transform)
+    
+    try:
+        keyed = [(upload_key(f), f.name, f) for f in image_files]
+        with spare_slots(workers - 1) as extra:
+            return run_batch(keyed, convert, cache, converted, failures, workers=1 + extra, on_item=on_item)
+    except ConversionCancelled as e:
+        st.warning(f"⏹️ {e} — kept {len(converted)} finished image(s)")
+        return converted
+    except Exception as e:
+        st.error(f"Error converting images: {str(e)}")
+        return None
+
 # Main conversion tabs
 tab1, tab2, tab3, tab4, tab5 = st.tabs([
     "📄 PDF to Images", 
@@ -501,87 +1542,155 @@ with tab1:
     with col2:
         output_format = st.selectbox(
             "Output Format",
-            ['PNG', 'JPEG', 'WEBP', 'BMP'],
+            [AUTO_FORMAT, 'PNG', 'JPEG', 'WEBP', 'BMP'],
             key="pdf_output_format",
-            help="Choose the output image format"
+            help="Choose the output image format. Auto picks the smallest suitable format for each page"
         )
         
         quality = st.slider("Quality", 1, 100, 85, help="Output quality (higher = better)")
+        dpi = st.select_slider(
+            "Resolution (DPI)",
+            [72, 100, 150, 200, 300],
+            value=RENDER_DPI,
+            key="pdf_dpi",
+            help="Rendering resolution; output size and memory grow with its square"
+        )
     
     if pdf_file and output_format:
-        if st.button("🚀 Start Conversion", key="convert_pdf_btn", use_container_width=True):
+        settings = (upload_key(pdf_file), output_format, quality, dpi)
+        sample = cached_sample('pdf_to_images', upload_key(pdf_file), lambda: sample_pdf(pdf_file.getvalue()))
+        estimate = cached_estimate(
+            'pdf_to_images', settings, sample,
+            partial(estimate_pdf_job, output_format=output_format, quality=quality, dpi=dpi)
+        )
+        show_estimate('pdf_to_images', output_format, estimate)
+        
+        col_start, col_cancel = st.columns([3, 1])
+        with col_start:
+            start_clicked = st.button("🚀 Start Conversion", key="convert_pdf_btn", use_container_width=True)
+        with col_cancel:
+            cancel_clicked = st.button(
+                "⏹️ Cancel",
+                key="cancel_pdf_btn",
+                use_container_width=True,
+                help="Stop a running conversion and keep the pages already finished"
+            )
+        
+        retry_slot = st.empty()
+        retry_shown = bool(st.session_state.get('pdf_failures'))
+        retry_clicked = retry_shown and retry_slot.button(
+            "🔁 Retry Failed Pages", key="retry_pdf_btn", use_container_width=True
+        )
+        
+        result_images = None
+        partial_result = False
+        if start_clicked or retry_clicked:
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            for i in range(100):
-                status_text.text(f"Processing... {i+1}%")
-                progress_bar.progress(i + 1)
-                time.sleep(0.01)
+            def show_page(page, page_count):
+                progress_bar.progress(page / page_count)
+                status_text.text(f"Converted page {page} of {page_count}")
+            
+            def show_elapsed(elapsed):
+                status_text.text(f"Rendering page... {elapsed:.0f}s")
             
+            # Finished pages are collected in session state so that clicking
+            # Cancel, which interrupts this run, can still deliver them.
+            st.session_state.pdf_partial_pages = []
+            failures = []
+            page_cache = session_cache('pdf_to_images', settings)
+            fresh_job = not page_cache
+            timing = {}
+            job = JobControl(on_tick=show_elapsed)
             with st.spinner("Converting PDF to images..."):
-                result_images = convert_pdf_to_images(pdf_file.read(), output_format)
-                
-                if result_images:
-                    st.balloons()
-                    st.markdown(f"""
-                    <div class="success-box">
-                        ✅ Successfully converted PDF to {len(result_images)} images!
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Update stats
-                    st.session_state.total_conversions += 1
-                    st.session_state.favorite_formats['PDF'] += 1
-                    
-                    # Download options
-                    col_d1, col_d2 = st.columns(2)
-                    
-                    with col_d1:
-                        if len(result_images) > 1:
-                            # Build zip in memory
-                            zip_buffer = io.BytesIO()
-                            with zipfile.ZipFile(zip_buffer, 'w') as zf:
-                                for filename, img_bytes in result_images:
-                                    zf.writestr(filename, img_bytes)
-                            zip_buffer.seek(0)
-                            zip_data = zip_buffer.getvalue()
-
-                            # Mobile-compatible download link
-                            st.markdown(
-                                mobile_download_link(
-                                    zip_data,
-                                    "converted_images.zip",
-                                    "📦 Download All (ZIP)",
-                                    "application/zip"
-                                ),
-                                unsafe_allow_html=True
-                            )
-                        else:
-                            # Single image download
-                            fname, img_data = result_images[0]
-                            ext = fname.rsplit('.', 1)[-1].lower()
-                            mime = f"image/{ext}"
-                            st.markdown(
-                                mobile_download_link(img_data, fname, f"📥 Download Image", mime),
-                                unsafe_allow_html=True
-                            )
-                    
-                    with col_d2:
-                        # Preview first image
-                        st.markdown("**Preview:**")
-                        st.image(result_images[0][1], caption=result_images[0][0], use_container_width=True)
-                    
-                    # Add to history
-                    st.session_state.conversion_history.append({
-                        'type': 'PDF to Images',
-                        'input': pdf_file.name,
-                        'output': f"{len(result_images)} images",
-                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        'format': output_format
-                    })
-                    
-                    progress_bar.empty()
-                    status_text.empty()
+                result_images = run_admitted(
+                    pdf_file.size,
+                    partial(convert_pdf_to_images, job=job,
+                            results=st.session_state.pdf_partial_pages, on_page=show_page,
+                            cache=page_cache, failures=failures, dpi=dpi),
+                    pdf_file.getvalue(), output_format, quality,
+                    timing=timing
+                )
+            st.session_state.pdf_partial_pages = None
+            st.session_state.pdf_failures = failures
+            partial_result = job.reason is not None
+            progress_bar.empty()
+            status_text.empty()
+            show_failures(failures, "page")
+            offer_retry(retry_slot, retry_shown, failures, "🔁 Retry Failed Pages", "retry_pdf_btn")
+            if fresh_job and result_images and estimate and len(result_images) == estimate['items']:
+                record_job_cost('pdf_to_images', output_format, estimate, timing,
+                                sum(len(data) for _, data in result_images))
+            if result_images is not None and not failures and not partial_result:
+                # Nothing left to resume; a cancelled run keeps its pages
+                # until the next run finishes them.
+                drop_session_cache('pdf_to_images')
+        elif cancel_clicked:
+            result_images = st.session_state.pop('pdf_partial_pages', None)
+            partial_result = True
+            if result_images:
+                st.warning(f"⏹️ Conversion cancelled — kept the {len(result_images)} page(s) that finished")
+            elif result_images is not None:
+                st.info("⏹️ Conversion cancelled before any page finished")
+        
+        if result_images:
+            if partial_result:
+                st.info(f"📄 Partial result: only the {len(result_images)} page(s) finished before the "
+                        f"conversion stopped are included below")
+            else:
+                st.balloons()
+                st.markdown(f"""
+                <div class="success-box">
+                    ✅ Successfully converted PDF to {len(result_images)} images!
+                </div>
+                """, unsafe_allow_html=True)
+            
+            # Update stats
+            st.session_state.total_conversions += 1
+            st.session_state.favorite_formats['PDF'] += 1
+            
+            # Download options
+            col_d1, col_d2 = st.columns(2)
+            
+            with col_d1:
+                if len(result_images) > 1:
+                    # Build zip in memory
+                    zip_data = make_zip(result_images)
+
+                    # Mobile-compatible download link
+                    st.markdown(
+                        mobile_download_link(
+                            zip_data,
+                            "converted_images.zip",
+                            "📦 Download All (ZIP)",
+                            "application/zip"
+                        ),
+                        unsafe_allow_html=True
+                    )
+                else:
+                    # Single image download
+                    fname, img_data = result_images[0]
+                    ext = fname.rsplit('.', 1)[-1].lower()
+                    mime = f"image/{ext}"
+                    st.markdown(
+                        mobile_download_link(img_data, fname, f"📥 Download Image", mime),
+                        unsafe_allow_html=True
+                    )
+            
+            with col_d2:
+                # Preview first image
+                st.markdown("**Preview:**")
+                st.image(result_images[0][1], caption=result_images[0][0], use_container_width=True)
+            
+            # Add to history
+            st.session_state.conversion_history.append({
+                'type': 'PDF to Images',
+                'input': pdf_file.name,
+                'output': f"{len(result_images)} images" + (" (partial)" if partial_result else ""),
+                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'format': output_format
+            })
 
 with tab2:
     st.markdown('<div class="section-header">🖼️ Create PDF from Images</div>', unsafe_allow_html=True)
@@ -602,74 +1711,159 @@ with tab2:
         cols = st.columns(min(4, len(image_files)))
         for idx, img_file in enumerate(image_files[:4]):
             with cols[idx]:
-                st.image(img_file, caption=f"Image {idx+1}", use_container_width=True)
+                try:
+                    st.image(img_file, caption=f"Image {idx+1}", use_container_width=True)
+                except Exception:
+                    st.caption(f"⚠️ Image {idx+1}: preview unavailable")
         
         if len(image_files) > 4:
             st.caption(f"... and {len(image_files) - 4} more images")
         
+        upload_keys = tuple(upload_key(f) for f in image_files)
+        sample = cached_sample('images_to_pdf', upload_keys, partial(sample_images, image_files))
+        estimate = cached_estimate(
+            'images_to_pdf', upload_keys, sample,
+            partial(estimate_image_job, output_format='PDF', to_pdf=True)
+        )
+        show_estimate('images_to_pdf', 'PDF', estimate)
+        
         col1, col2, col3 = st.columns(3)
         with col2:
-            if st.button("📄 Create PDF", key="pdf_btn", use_container_width=True):
+            create_clicked = st.button("📄 Create PDF", key="pdf_btn", use_container_width=True)
+            retry_slot = st.empty()
+            retry_shown = bool(st.session_state.get('img_to_pdf_failures'))
+            retry_clicked = retry_shown and retry_slot.button(
+                "🔁 Retry Failed Images", key="retry_img_to_pdf_btn", use_container_width=True
+            )
+            
+            if create_clicked or retry_clicked:
+                failures = []
+                image_cache = session_cache('images_to_pdf', None)
+                fresh_job = not image_cache
+                timing = {}
+                job = JobControl()
                 with st.spinner("Creating PDF..."):
-                    pdf_data = convert_images_to_pdf(image_files)
-                    
-                    if pdf_data:
-                        st.balloons()
-                        st.success(f"✅ PDF created successfully!")
+                    pdf_data = run_admitted(
+                        sum(f.size for f in image_files), convert_images_to_pdf, image_files,
+                        job, image_cache, failures, timing=timing
+                    )
+                st.session_state.img_to_pdf_failures = failures
+                if fresh_job and pdf_data and not failures:
+                    record_job_cost('images_to_pdf', 'PDF', estimate, timing, len(pdf_data))
+                if not failures and job.reason is None:
+                    drop_session_cache('images_to_pdf')
+                show_failures(failures, "image")
+                offer_retry(retry_slot, retry_shown, failures, "🔁 Retry Failed Images", "retry_img_to_pdf_btn")
+                
+                if pdf_data:
+                    st.balloons()
+                    st.success(f"✅ PDF created successfully!")
 
-                        # Mobile-compatible download link
-                        st.markdown(
-                            mobile_download_link(
-                                pdf_data,
-                                "converted_images.pdf",
-                                "📥 Download PDF",
-                                "application/pdf"
-                            ),
-                            unsafe_allow_html=True
-                        )
-                        
-                        # Update stats
-                        st.session_state.total_conversions += 1
-                        st.session_state.favorite_formats['Images'] += 1
-                        
-                        st.session_state.conversion_history.append({
-                            'type': 'Images to PDF',
-                            'input': f"{len(image_files)} images",
-                            'output': "PDF file",
-                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        })
+                    # Mobile-compatible download link
+                    st.markdown(
+                        mobile_download_link(
+                            pdf_data,
+                            "converted_images.pdf",
+                            "📥 Download PDF",
+                            "application/pdf"
+                        ),
+                        unsafe_allow_html=True
+                    )
+                    
+                    # Update stats
+                    st.session_state.total_conversions += 1
+                    st.session_state.favorite_formats['Images'] += 1
+                    
+                    st.session_state.conversion_history.append({
+                        'type': 'Images to PDF',
+                        'input': f"{len(image_files)} images",
+                        'output': "PDF file",
+                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
 
 with tab3:
     st.markdown('<div class="section-header">🎨 Image Format Converter</div>', unsafe_allow_html=True)
-    st.markdown("Convert images between different formats with ease")
+    st.markdown("Convert, resize and clean up one image or a whole batch")
     
     col1, col2 = st.columns(2)
     
     with col1:
-        image_file = st.file_uploader(
-            "Select image",
+        image_files = st.file_uploader(
+            "Select images",
             type=['png', 'jpg', 'jpeg', 'webp', 'bmp', 'gif'],
+            accept_multiple_files=True,
             key="img_convert",
             help="Supported: PNG, JPG, JPEG, WEBP, BMP, GIF"
         )
         
-        if image_file:
-            st.image(image_file, caption="Original", use_container_width=True)
+        if len(image_files or []) == 1:
+            try:
+                st.image(image_files[0], caption="Original", use_container_width=True)
+            except Exception:
+                st.caption("⚠️ Preview unavailable")
+        elif image_files:
+            st.markdown(f'<div class="file-info">📁 Selected {len(image_files)} images</div>', unsafe_allow_html=True)
     
     with col2:
         to_format = st.selectbox(
             "Convert to",
-            ['PNG', 'JPEG', 'WEBP', 'BMP', 'GIF'],
-            key="to_format"
+            [AUTO_FORMAT, 'PNG', 'JPEG', 'WEBP', 'BMP', 'GIF'],
+            key="to_format",
+            help="Auto picks the smallest suitable format for the image"
         )
         
-        if image_file:
-            if st.button("🎯 Convert Now", key="convert_btn", use_container_width=True):
-                with st.spinner("Converting..."):
-                    result = convert_image_format(image_file, to_format)
+        with st.expander("📐 Resize & Transform", expanded=False):
+            resize_mode = st.selectbox("Resize", RESIZE_MODES, key="resize_mode")
+            resize_value = None
+            if resize_mode == RESIZE_MAX_EDGE:
+                resize_value = st.number_input("Longest edge (px)", min_value=16, max_value=20000, value=1600, step=100)
+            elif resize_mode == RESIZE_EXACT_BOX:
+                col_w, col_h = st.columns(2)
+                with col_w:
+                    box_width = st.number_input("Width (px)", min_value=1, max_value=20000, value=1024)
+                with col_h:
+                    box_height = st.number_input("Height (px)", min_value=1, max_value=20000, value=1024)
+                resize_value = (box_width, box_height)
+            elif resize_mode == RESIZE_PERCENT:
+                resize_value = st.slider("Scale (%)", 1, 200, 50)
+            strip_metadata = st.checkbox(
+                "Strip metadata",
+                value=True,
+                help="Drop EXIF (camera, GPS), ICC profiles and text chunks. Colours are converted to sRGB first "
+                     "and orientation is always applied."
+            )
+        transform = {'resize_mode': resize_mode, 'resize_value': resize_value, 'strip_metadata': strip_metadata}
+        
+        if image_files:
+            workers = st.session_state.get('parallel_conversions', 2)
+            batch_settings = (to_format, tuple(sorted(transform.items())))
+            upload_keys = tuple(upload_key(f) for f in image_files)
+            sample = cached_sample('image_convert', upload_keys, partial(sample_images, image_files))
+            estimate = cached_estimate(
+                'image_convert', (upload_keys, batch_settings, workers), sample,
+                partial(estimate_image_job, output_format=to_format, workers=workers, **transform)
+            )
+            show_estimate('image_convert', to_format, estimate)
+            
+            convert_clicked = st.button("🎯 Convert Now", key="convert_btn", use_container_width=True)
+            retry_slot = st.empty()
+            retry_shown = len(image_files) > 1 and bool(st.session_state.get('img_convert_failures'))
+            retry_clicked = retry_shown and retry_slot.button(
+                "🔁 Retry Failed Images", key="retry_img_convert_btn", use_container_width=True
+            )
+            
+            if convert_clicked or retry_clicked:
+                total_size = sum(f.size for f in image_files)
+                timing = {}
+                if len(image_files) == 1:
+                    with st.spinner("Converting..."):
+                        converted = run_admitted(total_size, partial(convert_image_format, **transform),
+                                                 image_files[0], to_format, timing=timing)
+                    if converted:
+                        record_job_cost('image_convert', to_format, estimate, timing, len(converted[1]))
                     
-                    if result:
-                        filename, img_bytes = result
+                    if converted:
+                        filename, img_bytes = converted
                         st.success("✅ Conversion complete!")
                         
                         st.image(img_bytes, caption="Converted", use_container_width=True)
@@ -681,21 +1875,63 @@ with tab3:
                             mobile_download_link(
                                 img_bytes,
                                 filename,
-                                f"📥 Download as {to_format}",
+                                f"📥 Download as {ext.upper()}",
                                 mime
                             ),
                             unsafe_allow_html=True
                         )
-                        
-                        # Update stats
-                        st.session_state.total_conversions += 1
-                        
-                        st.session_state.conversion_history.append({
-                            'type': 'Image Format',
-                            'input': f"{Path(image_file.name).suffix} image",
-                            'output': f"{to_format} image",
-                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        })
+                else:
+                    failures = []
+                    cache = session_cache('image_convert', batch_settings)
+                    fresh_job = not cache
+                    progress_bar = st.progress(0)
+                    job = JobControl()
+                    
+                    # Also a checkpoint: a rerun stops the batch here, and the
+                    # images finished so far stay in the session cache.
+                    def show_progress(done, total):
+                        progress_bar.progress(done / total, text=f"Converted {done} of {total} images")
+                    
+                    with st.spinner(f"Converting {len(image_files)} images..."):
+                        converted = run_admitted(
+                            total_size,
+                            partial(convert_images_batch, workers=workers, job=job, cache=cache,
+                                    failures=failures, on_item=show_progress, **transform),
+                            image_files, to_format, timing=timing
+                        )
+                    progress_bar.empty()
+                    st.session_state.img_convert_failures = failures
+                    if converted is not None and not failures and job.reason is None:
+                        drop_session_cache('image_convert')
+                    if fresh_job and converted and not failures:
+                        record_job_cost('image_convert', to_format, estimate, timing,
+                                        sum(len(data) for _, data in converted))
+                    show_failures(failures, "image")
+                    offer_retry(retry_slot, retry_shown, failures, "🔁 Retry Failed Images", "retry_img_convert_btn")
+                    
+                    if converted:
+                        st.success(f"✅ Converted {len(converted)} images!")
+                        st.markdown(
+                            mobile_download_link(
+                                make_zip(converted),
+                                "converted_images.zip",
+                                "📦 Download All (ZIP)",
+                                "application/zip"
+                            ),
+                            unsafe_allow_html=True
+                        )
+                
+                if converted:
+                    # Update stats
+                    st.session_state.total_conversions += 1
+                    
+                    st.session_state.conversion_history.append({
+                        'type': 'Image Format',
+                        'input': f"{Path(image_files[0].name).suffix} image" if len(image_files) == 1
+                                 else f"{len(image_files)} images",
+                        'output': f"{to_format} image" if len(image_files) == 1 else f"{to_format} images (ZIP)",
+                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
 
 with tab4:
     st.markdown('<div class="section-header">📊 Analytics Dashboard</div>', unsafe_allow_html=True)
@@ -778,7 +2014,11 @@ with tab5:
     with col2:
         st.markdown("#### ⚡ Performance")
         max_file_size = st.number_input("Max File Size (MB)", min_value=10, max_value=500, value=200)
-        parallel_conversions = st.slider("Parallel Conversions", 1, 5, 2)
+        parallel_conversions = st.slider(
+            "Parallel Conversions", 1, 5, 2,
+            key="parallel_conversions",
+            help="Images converted at once in a batch"
+        )
     
     st.markdown("#### 💾 Storage")
     col_s1, col_s2 = st.columns(2)
@@ -817,6 +2057,14 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
     
+    server_load = get_scheduler().stats()
+    st.markdown(f"""
+    <div class="stats-card">
+        <strong>Server jobs running:</strong> {server_load['running']}/{MAX_CONCURRENT_CONVERSIONS}<br>
+        <strong>Server jobs queued:</strong> {server_load['queued']}
+    </div>
+    """, unsafe_allow_html=True)
+    
     st.markdown("---")
     
     st.markdown("## 💡 Pro Tips")
@@ -827,6 +2075,7 @@ with st.sidebar:
         - 📚 Convert multiple PDFs to images in one go
         - 🔄 Images to PDF preserves original order
         - 🚀 WEBP offers better compression
+        - 🤖 Auto picks the smallest format for each page
         - 💾 Batch download saves time
         """)
     
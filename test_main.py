@@ -0,0 +1,618 @@
+"""Unit tests for the pure helpers in main.py.
+
+main.py is a Streamlit script; importing it outside ``streamlit run`` runs
+the page once in bare mode (widgets return their defaults), which leaves
+the module-level helpers ready to test.
+
+    python -m pytest -q test_main.py
+"""
+import io
+import re
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, JpegImagePlugin, UnidentifiedImageError
+
+import main
+from main import (RESIZE_EXACT_BOX, RESIZE_MAX_EDGE, RESIZE_ORIGINAL, RESIZE_PERCENT, ConversionCancelled,
+                  ConversionScheduler, CostModel, JobControl, PageTimeout, QueueFullError, analyze_image,
+                  cached_sample, choose_output_format, convert_images_to_pdf, encode_pdf_page, make_zip,
+                  normalize_image, run_batch, sample_images, target_size, transform_image_file)
+
+
+def scheduler(max_concurrent=1, max_inflight_bytes=1000, max_queued=10):
+    return ConversionScheduler(max_concurrent, max_inflight_bytes, max_queued)
+
+
+# ── ConversionScheduler ────────────────────────────────────────────────────────
+def test_admits_up_to_max_concurrent():
+    sched = scheduler(max_concurrent=2)
+    tickets = [sched.submit('a', 1) for _ in range(3)]
+    assert [t.admitted for t in tickets] == [True, True, False]
+    assert sched.stats() == {'running': 2, 'queued': 1, 'inflight_bytes': 2}
+
+    sched.release(tickets[0])
+    assert tickets[2].admitted
+    assert sched.stats() == {'running': 2, 'queued': 0, 'inflight_bytes': 2}
+
+
+def test_sessions_are_admitted_round_robin():
+    sched = scheduler()
+    running = sched.submit('a', 1)
+    a2, a3 = sched.submit('a', 1), sched.submit('a', 1)
+    b1 = sched.submit('b', 1)
+
+    order = []
+    current = running
+    for _ in range(3):
+        sched.release(current)
+        current = next(t for t in (a2, a3, b1) if t.admitted and t not in order)
+        order.append(current)
+    assert order == [a2, b1, a3]
+
+
+def test_position_follows_admission_order():
+    sched = scheduler()
+    running = sched.submit('a', 1)
+    a2, a3 = sched.submit('a', 1), sched.submit('a', 1)
+    b1 = sched.submit('b', 1)
+    assert sched.position(running) == 0
+    assert [sched.position(t) for t in (a2, b1, a3)] == [1, 2, 3]
+
+
+def test_byte_budget_blocks_head_of_line():
+    sched = scheduler(max_concurrent=5, max_inflight_bytes=100)
+    big = sched.submit('a', 60)
+    blocked = sched.submit('b', 50)
+    small = sched.submit('c', 10)
+    # The small job would fit, but may not overtake the blocked one.
+    assert big.admitted and not blocked.admitted and not small.admitted
+
+    sched.release(big)
+    assert blocked.admitted and small.admitted
+    assert sched.stats()['inflight_bytes'] == 60
+
+
+def test_oversized_job_runs_alone():
+    sched = scheduler(max_concurrent=5, max_inflight_bytes=100)
+    huge = sched.submit('a', 500)
+    assert huge.admitted
+    other = sched.submit('b', 1)
+    assert not other.admitted
+    sched.release(huge)
+    assert other.admitted
+
+
+def test_queue_full_is_rejected():
+    sched = scheduler(max_queued=2)
+    sched.submit('a', 1)
+    sched.submit('a', 1)
+    sched.submit('b', 1)
+    with pytest.raises(QueueFullError):
+        sched.submit('c', 1)
+    assert sched.stats()['queued'] == 2
+
+
+def test_releasing_a_waiting_ticket_leaves_the_queue():
+    sched = scheduler()
+    running = sched.submit('a', 1)
+    abandoned = sched.submit('b', 1)
+    waiting = sched.submit('c', 1)
+
+    sched.release(abandoned)
+    assert not abandoned.admitted
+    assert sched.stats() == {'running': 1, 'queued': 1, 'inflight_bytes': 1}
+
+    sched.release(running)
+    assert waiting.admitted and not abandoned.admitted
+    sched.release(waiting)
+    assert sched.stats() == {'running': 0, 'queued': 0, 'inflight_bytes': 0}
+
+
+def test_try_acquire_only_takes_idle_slots():
+    sched = scheduler(max_concurrent=3)
+    running = sched.submit('a', 1)
+    spare = sched.try_acquire('a')
+    assert spare.admitted and sched.stats()['running'] == 2
+    sched.submit('b', 1)
+    # The last free slot went to b; nothing is left to take.
+    assert sched.try_acquire('a') is None
+    sched.release(spare)
+    sched.release(running)
+    sched.submit('c', 1)
+    sched.submit('d', 1)
+    sched.submit('e', 1)
+    assert sched.stats()['queued'] == 1
+    # A waiting job keeps its turn even once a slot frees up.
+    assert sched.try_acquire('a') is None
+
+
+def test_slot_caps_concurrency_across_threads():
+    sched = scheduler(max_concurrent=2)
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def job(session_id):
+        with sched.slot(session_id, 1):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=job, args=(f"s{i % 3}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert peak[0] == 2
+    assert sched.stats() == {'running': 0, 'queued': 0, 'inflight_bytes': 0}
+
+
+def test_slot_releases_on_error():
+    sched = scheduler()
+    with pytest.raises(RuntimeError):
+        with sched.slot('a', 5):
+            raise RuntimeError("boom")
+    assert sched.stats() == {'running': 0, 'queued': 0, 'inflight_bytes': 0}
+
+
+# ── JobControl ─────────────────────────────────────────────────────────────────
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+@pytest.fixture
+def spawned(monkeypatch):
+    """Record every process run_subprocess() starts."""
+    procs = []
+    popen = subprocess.Popen
+
+    def recording_popen(*args, **kwargs):
+        procs.append(popen(*args, **kwargs))
+        return procs[-1]
+
+    monkeypatch.setattr(main.subprocess, 'Popen', recording_popen)
+    return procs
+
+
+def test_run_subprocess_waits_for_success():
+    JobControl().run_subprocess(python('import time; time.sleep(0.3)'))
+
+
+def test_run_subprocess_reports_exit_status():
+    with pytest.raises(RuntimeError, match='status 3'):
+        JobControl().run_subprocess(python('raise SystemExit(3)'))
+
+
+def test_page_timeout_kills_the_process(spawned):
+    with pytest.raises(PageTimeout):
+        JobControl().run_subprocess(python('import time; time.sleep(30)'), timeout=0.5)
+    assert spawned[0].returncode is not None
+
+
+def test_cancel_kills_the_process(spawned):
+    job = JobControl(on_tick=lambda elapsed: job.cancel())
+    with pytest.raises(ConversionCancelled, match='cancelled'):
+        job.run_subprocess(python('import time; time.sleep(30)'))
+    assert spawned[0].returncode is not None
+
+
+def test_deadline_starts_when_the_job_does():
+    job = JobControl(timeout=0.2)
+    time.sleep(0.3)  # e.g. waiting for a server slot
+    job.start()
+    job.check()
+    time.sleep(0.3)
+    with pytest.raises(ConversionCancelled, match='timed out'):
+        job.check()
+
+
+# ── target_size / make_zip ─────────────────────────────────────────────────────
+@pytest.mark.parametrize('mode, value, expected', [
+    (RESIZE_ORIGINAL, None, (4000, 3000)),
+    (RESIZE_MAX_EDGE, 1000, (1000, 750)),
+    (RESIZE_MAX_EDGE, 8000, (4000, 3000)),  # never upscales
+    (RESIZE_EXACT_BOX, (640, 640), (640, 640)),
+    (RESIZE_PERCENT, 50, (2000, 1500)),
+    (RESIZE_PERCENT, 0.001, (1, 1)),
+])
+def test_target_size(mode, value, expected):
+    assert target_size((4000, 3000), mode, value) == expected
+
+
+def test_make_zip_renames_duplicates():
+    data = make_zip([('a.png', b'1'), ('a.png', b'2'), ('noext', b'3'), ('noext', b'4')])
+    assert zipfile.ZipFile(io.BytesIO(data)).namelist() == ['a.png', 'a_2.png', 'noext', 'noext_2']
+
+
+# ── transform_image_file ───────────────────────────────────────────────────────
+def upload(img, name, **save_kwargs):
+    """An in-memory stand-in for a Streamlit UploadedFile."""
+    buffer = io.BytesIO()
+    img.save(buffer, Image.registered_extensions()[name[name.rindex('.'):]], **save_kwargs)
+    buffer.name, buffer.size = name, buffer.tell()
+    return buffer
+
+
+def display_p3_profile():
+    """A minimal ICC v2 matrix/TRC profile with Display P3 primaries."""
+    def s15(value):
+        return struct.pack('>i', round(value * 65536))
+
+    def xyz(x, y, z):
+        return b'XYZ \0\0\0\0' + s15(x) + s15(y) + s15(z)
+
+    name = b'Display P3 test\0'
+    gamma = b'curv\0\0\0\0' + struct.pack('>IH', 1, round(2.2 * 256)) + b'\0\0'
+    tags = [
+        (b'desc', b'desc\0\0\0\0' + struct.pack('>I', len(name)) + name + bytes(78)),
+        (b'cprt', b'text\0\0\0\0none\0'),
+        (b'wtpt', xyz(0.9642, 1.0, 0.8249)),
+        (b'rXYZ', xyz(0.5151, 0.2412, -0.0011)),
+        (b'gXYZ', xyz(0.2920, 0.6922, 0.0419)),
+        (b'bXYZ', xyz(0.1571, 0.0666, 0.7841)),
+        (b'rTRC', gamma), (b'gTRC', gamma), (b'bTRC', gamma),
+    ]
+    offset, table, data = 128 + 4 + 12 * len(tags), b'', b''
+    for signature, tag in tags:
+        tag += bytes(-len(tag) % 4)
+        table += signature + struct.pack('>II', offset + len(data), len(tag))
+        data += tag
+    body = struct.pack('>I', len(tags)) + table + data
+    header = (struct.pack('>I', 128 + len(body)) + b'lcms' + bytes([2, 0x10, 0, 0]) + b'mntrRGB XYZ '
+              + bytes(12) + b'acspAPPL' + bytes(24) + s15(0.9642) + s15(1.0) + s15(0.8249) + bytes(48))
+    return header + body
+
+
+def decode(encoded):
+    filename, data = encoded
+    return filename, Image.open(io.BytesIO(data))
+
+
+def test_exif_orientation_is_applied_before_resizing():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90° clockwise
+    photo_file = upload(Image.new('RGB', (400, 200)), 'photo.jpg', exif=exif)
+    filename, out = decode(transform_image_file(photo_file, 'PNG', RESIZE_MAX_EDGE, 100))
+    assert (filename, out.size) == ('photo.png', (50, 100))
+    assert out.getexif().get(0x0112) is None
+
+
+def test_large_jpeg_downscale_decodes_with_draft(monkeypatch):
+    requested = []
+    draft = JpegImagePlugin.JpegImageFile.draft
+
+    def recording_draft(self, mode, size):
+        requested.append(size)
+        return draft(self, mode, size)
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, 'draft', recording_draft)
+    photo_file = upload(photo((2000, 1500)), 'big.jpg')
+    assert decode(transform_image_file(photo_file, 'PNG', RESIZE_MAX_EDGE, 200))[1].size == (200, 150)
+    assert requested == [(200, 150)]
+    requested.clear()
+    transform_image_file(photo_file, 'PNG')
+    assert requested == []
+
+
+def test_16_bit_images_can_be_resized():
+    scan = upload(Image.fromarray(np.full((300, 400), 30000, dtype=np.uint16)), 'scan.png')
+    _, out = decode(transform_image_file(scan, 'PNG', RESIZE_PERCENT, 25))
+    assert out.size == (100, 75) and out.getpixel((50, 37)) == 30000
+
+
+def test_stripping_converts_wide_gamut_to_srgb():
+    p3_file = upload(Image.new('RGB', (8, 8), (200, 100, 50)), 'p3.png', icc_profile=display_p3_profile())
+    _, stripped = decode(transform_image_file(p3_file, 'PNG'))
+    assert 'icc_profile' not in stripped.info
+    assert stripped.getpixel((0, 0)) != (200, 100, 50)
+    _, kept = decode(transform_image_file(p3_file, 'PNG', strip_metadata=False))
+    assert kept.info['icc_profile'] == display_p3_profile()
+    assert kept.getpixel((0, 0)) == (200, 100, 50)
+
+
+def test_kept_profile_is_dropped_when_the_mode_changes():
+    # The profile no longer describes the pixels once CMYK is saved as RGB.
+    cmyk_file = upload(Image.new('CMYK', (8, 8), (0, 50, 100, 0)), 'print.jpg', icc_profile=display_p3_profile())
+    _, out = decode(transform_image_file(cmyk_file, 'PNG', strip_metadata=False))
+    assert out.mode == 'RGB' and 'icc_profile' not in out.info
+
+
+# ── run_batch ──────────────────────────────────────────────────────────────────
+def items(*names):
+    return [(name, name.upper(), name) for name in names]
+
+
+def test_run_batch_isolates_failures_and_keeps_order():
+    def process(name):
+        if name == 'bad':
+            raise ValueError("broken")
+        if name == 'junk':
+            raise UnidentifiedImageError("cannot identify")
+        return name * 2
+
+    failures = []
+    results = run_batch(items('a', 'bad', 'b', 'junk', 'c'), process, failures=failures, workers=3)
+    assert results == ['aa', 'bb', 'cc']
+    assert failures == [('BAD', 'broken'), ('JUNK', 'not a readable image file')]
+
+
+def test_run_batch_reuses_cache_and_drops_stale_entries():
+    calls = []
+
+    def process(name):
+        calls.append(name)
+        return name
+
+    cache = {'a': 'cached a', 'gone': 'stale'}
+    results = run_batch(items('a', 'b'), process, cache=cache)
+    assert results == ['cached a', 'b']
+    assert calls == ['b']
+    assert cache == {'a': 'cached a', 'b': 'b'}
+
+
+def test_run_batch_retry_only_redoes_failures():
+    attempts = {'flaky': 0}
+
+    def process(name):
+        if name == 'flaky':
+            attempts['flaky'] += 1
+            if attempts['flaky'] == 1:
+                raise OSError("transient")
+        return name
+
+    cache = {}
+    first_failures = []
+    run_batch(items('ok', 'flaky'), process, cache=cache, failures=first_failures)
+    assert first_failures == [('FLAKY', 'transient')]
+
+    retry_failures = []
+    assert run_batch(items('ok', 'flaky'), process, cache=cache, failures=retry_failures) == ['ok', 'flaky']
+    assert retry_failures == []
+    assert attempts['flaky'] == 2
+
+
+def test_run_batch_propagates_cancellation():
+    def process(name):
+        if name == 'b':
+            raise ConversionCancelled("Conversion cancelled")
+        return name
+
+    results = []
+    with pytest.raises(ConversionCancelled):
+        run_batch(items('a', 'b', 'c'), process, results=results)
+    assert results == ['a']  # items finished before the cancellation are kept
+
+
+def test_run_batch_reports_progress():
+    progress = []
+    run_batch(items('a', 'b', 'c'), str.upper, on_item=lambda done, total: progress.append((done, total)))
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+
+
+
+
+# ── encode_pdf_page / convert_images_to_pdf ────────────────────────────────────
+def page_count(pdf):
+    return int(re.search(rb'/Count (\d+)', pdf).group(1))
+
+
+def test_pdf_pages_pass_jpegs_through_and_store_the_rest_losslessly():
+    jpeg = upload(photo((200, 150)), 'photo.jpg')
+    assert encode_pdf_page(jpeg) == jpeg.getvalue()
+    page = Image.open(io.BytesIO(encode_pdf_page(upload(Image.new('RGBA', (40, 30), (255, 0, 0, 0)), 'clip.png'))))
+    assert (page.format, page.mode, page.getpixel((0, 0))) == ('PNG', 'RGB', (255, 255, 255))
+    cmyk = upload(Image.new('CMYK', (40, 30)), 'print.tif')
+    assert Image.open(io.BytesIO(encode_pdf_page(cmyk))).format == 'JPEG'
+
+
+@pytest.mark.parametrize('size', [(2, 2), (30000, 10)])
+def test_pdf_page_outside_img2pdf_limits_is_rejected(size):
+    with pytest.raises(ValueError, match='Page size'):
+        encode_pdf_page(upload(Image.new('L', size), 'odd.png'))
+
+
+def test_bad_images_are_left_out_of_the_pdf():
+    junk = io.BytesIO(b'not an image')
+    junk.name, junk.size = 'junk.png', 12
+    files = [upload(photo((200, 150)), 'a.jpg'), upload(Image.new('L', (2, 2)), 'tiny.png'),
+             junk, upload(Image.new('L', (30000, 10)), 'strip.png'), upload(text_page((300, 400)), 'b.png')]
+    failures = []
+    pdf = convert_images_to_pdf(files, failures=failures)
+    assert page_count(pdf) == 2
+    assert [label for label, _ in failures] == ['tiny.png', 'junk.png', 'strip.png']
+
+
+# ── CostModel ──────────────────────────────────────────────────────────────────
+ESTIMATE = {'items': 4, 'bytes': 1000.0, 'seconds': 2.0, 'peak_bytes': 5000.0}
+
+
+def test_cost_model_without_history_returns_estimate():
+    corrected = CostModel().correct('pdf_to_images', 'PNG', ESTIMATE)
+    assert corrected == {**ESTIMATE, 'jobs': 0}
+
+
+def test_cost_model_learns_per_pipeline_and_format():
+    model = CostModel(learning_rate=0.5)
+    model.record('pdf_to_images', 'PNG', ESTIMATE, actual_seconds=4.0, actual_bytes=500)
+    corrected = model.correct('pdf_to_images', 'PNG', ESTIMATE)
+    # The first job sets the factors outright.
+    assert corrected['seconds'] == pytest.approx(4.0)
+    assert corrected['bytes'] == pytest.approx(500)
+    assert corrected['peak_bytes'] == ESTIMATE['peak_bytes']
+    assert corrected['jobs'] == 1
+
+    model.record('pdf_to_images', 'PNG', ESTIMATE, actual_seconds=2.0, actual_bytes=1000)
+    corrected = model.correct('pdf_to_images', 'PNG', ESTIMATE)
+    # Later jobs move the factors by learning_rate: 2.0 -> 1.5, 0.5 -> 0.75.
+    assert corrected['seconds'] == pytest.approx(3.0)
+    assert corrected['bytes'] == pytest.approx(750)
+    assert corrected['jobs'] == 2
+
+    assert model.correct('pdf_to_images', 'JPEG', ESTIMATE)['jobs'] == 0
+    assert model.correct('image_convert', 'PNG', ESTIMATE)['jobs'] == 0
+
+
+def test_sample_images_decodes_a_small_copy_of_the_largest():
+    files = [upload(photo((300, 200)), 'small.jpg'),
+             upload(Image.fromarray(np.zeros((1500, 2000), dtype=np.uint16)), 'scan.png')]
+    sample = sample_images(files)
+    assert sample['items'] == 2 and sample['sample'].size == (512, 384)
+    assert [header['size'] for header in sample['headers']] == [(300, 200), (2000, 1500)]
+
+
+def test_cached_sample_retries_after_a_full_queue(monkeypatch):
+    calls = []
+
+    def take_sample():
+        calls.append(1)
+        return len(calls)
+
+    @contextmanager
+    def full_queue(nbytes):
+        raise QueueFullError("busy")
+        yield
+
+    main.st.session_state.pop('cost_samples', None)
+    monkeypatch.setattr(main, 'conversion_slot', full_queue)
+    assert cached_sample('test', 'key', take_sample) is None
+    monkeypatch.undo()
+    assert cached_sample('test', 'key', take_sample) == 1
+    assert cached_sample('test', 'key', take_sample) == 1
+    assert calls == [1]
+
+
+def test_cached_sample_remembers_sampling_failures():
+    calls = []
+
+    def broken_sample():
+        calls.append(1)
+        raise OSError("truncated file")
+
+    main.st.session_state.pop('cost_samples', None)
+    assert cached_sample('test', 'key', broken_sample) is None
+    assert cached_sample('test', 'key', broken_sample) is None
+    assert calls == [1]
+
+
+# ── normalize_image ────────────────────────────────────────────────────────────
+def gray16(values):
+    return Image.fromarray(np.array([values], dtype=np.uint16))
+
+
+def pixels(img):
+    return np.asarray(img).ravel().tolist()
+
+
+def test_16_bit_is_scaled_by_mode_range_not_content():
+    assert pixels(normalize_image(gray16([30000, 30000]), 'PDF')) == [117, 117]
+    assert pixels(normalize_image(gray16([0, 4000, 8000]), 'JPEG')) == [0, 16, 31]
+    # One brighter pixel must not change how the others are scaled.
+    assert pixels(normalize_image(gray16([0, 200]), 'JPEG')) == [0, 1]
+    assert pixels(normalize_image(gray16([0, 200, 300]), 'JPEG')) == [0, 1, 1]
+    assert pixels(normalize_image(gray16([0, 65535]), 'JPEG')) == [0, 255]
+
+
+def test_32_bit_modes_use_fixed_ranges():
+    as_int = Image.fromarray(np.array([[-5, 32768, 70000]], dtype=np.int32))
+    assert pixels(normalize_image(as_int, 'JPEG')) == [0, 128, 255]
+    as_float = Image.fromarray(np.array([[0.0, 0.5, 1.0, 2.0]], dtype=np.float32))
+    assert pixels(normalize_image(as_float, 'JPEG')) == [0, 128, 255, 255]
+
+
+def test_png_keeps_16_bit_grayscale():
+    big_endian = Image.frombytes('I;16B', (3, 1), np.array([0, 30000, 65535], '>u2').tobytes())
+    for img in (gray16([0, 30000, 65535]), big_endian):
+        out = normalize_image(img, 'PNG')
+        assert out.mode == 'I;16'
+        buffer = io.BytesIO()
+        out.save(buffer, 'PNG')
+        assert pixels(Image.open(buffer)) == [0, 30000, 65535]
+
+
+def test_alpha_is_kept_or_flattened_onto_white():
+    img = Image.new('RGBA', (2, 1), (255, 0, 0, 255))
+    img.putpixel((1, 0), (0, 0, 255, 0))
+    assert normalize_image(img, 'PNG') is img
+    flat = normalize_image(img, 'JPEG')
+    assert flat.mode == 'RGB'
+    assert [flat.getpixel((0, 0)), flat.getpixel((1, 0))] == [(255, 0, 0), (255, 255, 255)]
+    assert normalize_image(Image.new('LA', (1, 1), (10, 0)), 'JPEG').getpixel((0, 0)) == 255
+
+
+@pytest.mark.parametrize('mode, target, expected', [
+    ('CMYK', 'JPEG', 'RGB'),
+    ('CMYK', 'PDF', 'CMYK'),
+    ('P', 'PNG', 'P'),
+    ('P', 'WEBP', 'RGB'),
+    ('1', 'JPEG', 'L'),
+    ('LA', 'WEBP', 'RGBA'),
+])
+def test_modes_map_onto_encoder_modes(mode, target, expected):
+    assert normalize_image(Image.new(mode, (4, 4)), target).mode == expected
+
+
+def test_palette_transparency_survives_only_where_supported():
+    img = Image.new('P', (2, 1))
+    img.info['transparency'] = 0
+    assert normalize_image(img, 'GIF').mode == 'P'
+    assert normalize_image(img, 'WEBP').mode == 'RGBA'
+    assert normalize_image(img, 'JPEG').mode == 'RGB'
+
+
+# ── choose_output_format ───────────────────────────────────────────────────────
+def photo(size=(1200, 900), seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    base = np.stack([x * 255 // size[0], y * 255 // size[1], (x + y) * 127 // sum(size)], -1)
+    return Image.fromarray(np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8))
+
+
+def text_page(size=(1240, 1754)):
+    page = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(page)
+    for line in range(60, size[1] - 60, 30):
+        draw.text((60, line), "The quick brown fox jumps over the lazy dog. " * 3, fill='black', font_size=20)
+    return page
+
+
+def test_flatness_separates_photos_from_pages():
+    assert analyze_image(photo())['flat_fraction'] < 0.55
+    assert analyze_image(text_page())['flat_fraction'] > 0.55
+
+
+def test_auto_picks_lossy_for_photos():
+    img, fmt, save_kwargs = choose_output_format(photo(), quality=80)
+    assert fmt in ('JPEG', 'WEBP') and save_kwargs['quality'] == 80
+    assert img.mode == 'RGB'
+
+
+def test_auto_keeps_alpha_for_transparent_photos():
+    img = photo().convert('RGBA')
+    img.putalpha(128)
+    out, fmt, save_kwargs = choose_output_format(img)
+    assert (fmt, out.mode) == ('WEBP', 'RGBA')
+
+
+def test_auto_picks_lossless_for_text_pages():
+    for page in (text_page(), text_page().convert('L')):
+        img, fmt, save_kwargs = choose_output_format(page)
+        assert fmt in ('PNG', 'WEBP') and 'quality' not in save_kwargs
+
+
+def test_auto_palette_candidates_compete_with_lossless_webp():
+    page = text_page()
+    assert analyze_image(page)['colors'] is not None
+    img, fmt, save_kwargs = choose_output_format(page)
+    # Lossless WEBP beats a palette PNG by far on antialiased text.
+    assert (fmt, save_kwargs) == ('WEBP', {'lossless': True})
+    assert img.mode == 'RGB'